@@ -1,11 +1,40 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Tuple
-import requests
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import List, Tuple, Optional, Literal
 import random
-from dataclasses import dataclass
+import asyncio
+from dataclasses import dataclass, asdict
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+from profiles import (
+    Profile, get_profile, get_profiles, get_extra_frames, profile_cache_stats, stored_profiles, frames_cache,
+    open_upstream_client, close_upstream_client, check_provider, DETAIL_FULL
+)
+from profile_store import load_profile_store
+from scoring import cached_compatibility, render_result, pair_cache
+from matrix_pool import score_department, department_partners, stream_rows, close_matrix_pool
+from explanations import pick_language
+from metrics import MetricsMiddleware, set_department_size, render_metrics
+from profiling import ProfilingMiddleware
+from compat_matrix import pack_profiles
+from streaming import encode_event, MEDIA_TYPES
+from departments import Department, create_department, get_department
+from settings import TWO_PEOPLE_DETAIL, DEPARTMENT_DETAIL
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    check_provider()
+    load_profile_store()
+    await open_upstream_client()
+    yield
+    await close_upstream_client()
+    close_matrix_pool()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 class PersonInfo(BaseModel):
     full_name: str
@@ -14,15 +43,13 @@ class PersonInfo(BaseModel):
 class TwoPeopleCompatibilityRequest(BaseModel):
     person1: PersonInfo
     person2: PersonInfo
+    detail: Optional[Literal["astro", "full"]] = None
 
 class DepartmentCompatibilityRequest(BaseModel):
     people: List[PersonInfo]
-
-@dataclass
-class CompatibilityResult:
-    total_score: int
-    compatibility_level: str
-    explanations: Dict[str, List[str]]
+    detail: Optional[Literal["astro", "full"]] = None
+    # Вместо полной матрицы вернуть top_k лучших и худших партнёров каждого сотрудника.
+    top_k: Optional[int] = Field(None, ge=1)
 
 @dataclass
 class GroupCompatibilityResult:
@@ -30,180 +57,8 @@ class GroupCompatibilityResult:
     total_score: int
     recommendation: str
 
-async def analyze_elements(elements1: Dict[str, float], elements2: Dict[str, float]):
-    score = 0
-    explanation = []
-    for element in ["Огонь", "Земля", "Воздух", "Вода"]:
-        if elements1[element] > 40 and elements2[element] > 40:
-            score -= 2
-            explanation.append(f"- Обе стороны имеют доминирующую стихию {element}, это может привести к однотипному подходу и конфликтам.")
-        elif abs(elements1[element] - elements2[element]) < 20:
-            score += 2
-            explanation.append(f"+ Стихия {element} сбалансирована между людьми, что способствует гармонии.")
-        else:
-            explanation.append(f"- Стихия {element} несбалансирована: {elements1[element]:.1f}% у одного, {elements2[element]:.1f}% у другого.")
-    dominant_elements1 = sum(1 for v in elements1.values() if v > 40)
-    dominant_elements2 = sum(1 for v in elements2.values() if v > 40)
-    if dominant_elements1 == 0 and dominant_elements2 == 0:
-        score += 3
-        explanation.append("+ У обоих нет доминирующей стихии, что способствует гибкости и адаптивности.")
-    elif dominant_elements1 > 1 or dominant_elements2 > 1:
-        score -= 3
-        explanation.append("- У одного из участников доминирует несколько стихий, что может усложнить взаимодействие.")
-    return score, explanation
-
-async def analyze_behaviors(behaviors1: Dict[str, float], behaviors2: Dict[str, float]):
-    score = 0
-    explanation = []
-    for strategy in ["Кардинальность", "Фиксированность", "Мутабельность"]:
-        if behaviors1[strategy] > 40 and behaviors2[strategy] > 40:
-            score -= 2
-            explanation.append(f"- Оба имеют доминирующую стратегию {strategy}, что может привести к столкновению интересов.")
-        elif abs(behaviors1[strategy] - behaviors2[strategy]) < 20:
-            score += 3
-            explanation.append(f"+ Стратегия {strategy} уравновешена между участниками, это улучшает совместимость.")
-        else:
-            explanation.append(f"- Различия в стратегии {strategy} могут вызывать недопонимание (у одного {behaviors1[strategy]:.1f}%, у другого {behaviors2[strategy]:.1f}%).")
-    dominant_strategies1 = sum(1 for v in behaviors1.values() if v > 40)
-    dominant_strategies2 = sum(1 for v in behaviors2.values() if v > 40)
-    if dominant_strategies1 == 1 and dominant_strategies2 == 1:
-        score += 2
-        explanation.append("+ У обоих участников доминирует только одна стратегия, что способствует сосредоточенности.")
-    elif dominant_strategies1 > 1 or dominant_strategies2 > 1:
-        score -= 2
-        explanation.append("- У одного из участников слишком много доминирующих стратегий, что может усложнить взаимодействие.")
-    return score, explanation
-
-async def analyze_astrology(astrology1: Dict[str, str], astrology2: Dict[str, str]):
-    score = 0
-    explanation = []
-    if astrology1["Солнце"] == astrology2["Луна"] or astrology2["Солнце"] == astrology1["Луна"]:
-        score += 3
-        explanation.append("+ Солнце и Луна гармонируют, это улучшает эмоциональную совместимость.")
-    else:
-        score -= 1
-        explanation.append("- Солнце и Луна не гармонируют, возможны эмоциональные разногласия.")
-    if astrology1["Венера"] == astrology2["Марс"] or astrology2["Венера"] == astrology1["Марс"]:
-        score += 2
-        explanation.append("+ Венера и Марс гармонируют, это улучшает социальные и профессиональные отношения.")
-    else:
-        score -= 2
-        explanation.append("- Венера и Марс не гармонируют, возможны трудности в личных и рабочих взаимодействиях.")
-    if astrology1["Солнце"][:1] == astrology2["Солнце"][:1]:
-        score += 2
-        explanation.append("+ Солнце в знаках одной стихии, это улучшает понимание и общие цели.")
-    else:
-        explanation.append("- Солнце в разных стихиях, возможны разногласия в подходе к задачам.")
-    return score, explanation
-
-async def calculate_compatibility(elements1, elements2, behaviors1, behaviors2, astrology1, astrology2):
-    element_score, element_explanation = await analyze_elements(elements1, elements2)
-    behavior_score, behavior_explanation = await analyze_behaviors(behaviors1, behaviors2)
-    astrology_score, astrology_explanation = await analyze_astrology(astrology1, astrology2)
-    total_score = element_score + behavior_score + astrology_score
-    if total_score >= 8:
-        level = "Высокая совместимость"
-    elif 4 <= total_score < 8:
-        level = "Средняя совместимость"
-    else:
-        level = "Низкая совместимость"
-    explanations = {
-        "Стихии": element_explanation,
-        "Стратегии поведения": behavior_explanation,
-        "Астрология": astrology_explanation,
-    }
-    return CompatibilityResult(total_score=total_score, compatibility_level=level, explanations=explanations)
-
-def map_planet_to_sign(sign_index):
-    signs = ["Овен", "Телец", "Близнецы", "Рак", "Лев", "Дева", "Весы", "Скорпион", "Стрелец", "Козерог", "Водолей", "Рыбы"]
-    if 0 <= sign_index < len(signs):
-        return signs[sign_index]
-    else:
-        return "Неизвестно"
-
-async def get_real_data(person: PersonInfo):
-    url = "https://www.lifexpert.ru/jui/rpc/"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    date_str = person.birth_date
-    payload = [
-        {
-            "jsonrpc": "2.0",
-            "id": 53,
-            "method": "datetime_calcs.astro_frame",
-            "params": {
-                "date": date_str,
-                "coord": {
-                    "lat": 59.9503,
-                    "lng": 30.3903,
-                    "country": "RU",
-                    "verbose": "Центральный р-н, Санкт-Петербург"
-                },
-                "options": {
-                    "houses_system": "K",
-                    "use_aspect_node": False,
-                    "use_aspect_lilith": False
-                }
-            }
-        },
-        {
-            "jsonrpc": "2.0",
-            "id": 54,
-            "method": "datetime_calcs.destinywill",
-            "params": {
-                "date": date_str
-            }
-        },
-        {
-            "jsonrpc": "2.0",
-            "id": 55,
-            "method": "datetime_calcs.pifagor_frame",
-            "params": {
-                "date": date_str,
-                "death_date": None,
-                "fio": [],
-                "use_1999": False
-            }
-        }
-    ]
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 200:
-        data = response.json()
-        if not data or 'result' not in data[0]:
-            raise Exception(f"Invalid data received for {person.full_name}")
-        astro_frame = data[0]['result']
-        elements_data = astro_frame['elements']
-        elements = {
-            "Огонь": elements_data['elements']['fire'] * 100,
-            "Земля": elements_data['elements']['earth'] * 100,
-            "Воздух": elements_data['elements']['air'] * 100,
-            "Вода": elements_data['elements']['water'] * 100
-        }
-        behaviors = {
-            "Кардинальность": elements_data['strategy']['cardinal'] * 100,
-            "Фиксированность": elements_data['strategy']['constant'] * 100,
-            "Мутабельность": elements_data['strategy']['mutable'] * 100
-        }
-        planets = astro_frame['planets']
-        astrology = {}
-        for planet_name in ["sun", "moon", "venus", "mars", "jupiter", "saturn"]:
-            if planet_name in planets and len(planets[planet_name]) > 1:
-                sign_index = planets[planet_name][1]
-                astrology_name = {
-                    "sun": "Солнце",
-                    "moon": "Луна",
-                    "venus": "Венера",
-                    "mars": "Марс",
-                    "jupiter": "Юпитер",
-                    "saturn": "Сатурн"
-                }[planet_name]
-                astrology[astrology_name] = map_planet_to_sign(sign_index)
-            else:
-                astrology[astrology_name] = "Неизвестно"
-        return elements, behaviors, astrology
-    else:
-        raise Exception(f"API request failed with status code {response.status_code}")
+async def get_real_data(person: PersonInfo) -> Profile:
+    return await get_profile(person.birth_date, person.full_name)
 
 MOTIVATIONAL_RECOMMENDATIONS = [
     "Проведите индивидуальную беседу для понимания текущих трудностей сотрудника.",
@@ -263,35 +118,34 @@ def generate_recommendation(score: int, average_score: float) -> str:
 
 
 
-async def calculate_group_compatibility(people_data: List[Dict]) -> Tuple[List[GroupCompatibilityResult], List[List[int]]]:
+async def calculate_group_compatibility(people: List[PersonInfo], profiles: List[Profile],
+                                        top_k: Optional[int] = None) -> Tuple[List[GroupCompatibilityResult], List]:
     """
     Рассчитывает совместимость группы сотрудников и возвращает результаты с рекомендациями и матрицу совместимости.
 
-    :param people_data: Список данных о сотрудниках.
-    :return: Кортеж из списка результатов и матрицы совместимости.
+    :param people: Список сотрудников.
+    :param profiles: Профили сотрудников в том же порядке.
+    :param top_k: Если задан, вместо матрицы возвращаются top_k лучших и худших партнёров каждого сотрудника;
+        матрица n×n при этом целиком в памяти не хранится.
+    :return: Кортеж из списка результатов и матрицы совместимости (или списка партнёров).
     """
-    n = len(people_data)
+    n = len(people)
     results = []
-    compatibility_matrix = [[0 for _ in range(n)] for _ in range(n)]
-
-    total_sum_score = 0
-    for i in range(n):
-        for j in range(i + 1, n):
-            compatibility = await calculate_compatibility(
-                people_data[i]['elements'], people_data[j]['elements'],
-                people_data[i]['behaviors'], people_data[j]['behaviors'],
-                people_data[i]['astrology'], people_data[j]['astrology']
-            )
-            compatibility_score = compatibility.total_score
-            compatibility_matrix[i][j] = compatibility_score
-            compatibility_matrix[j][i] = compatibility_score
-            total_sum_score += compatibility_score
+    if top_k is None:
+        matrix, row_totals = await score_department(profiles)
+        compatibility_matrix = matrix.tolist()
+    else:
+        partners = await department_partners(profiles, top_k)
+        row_totals = partners.row_totals
+        compatibility_matrix = partners.to_list([person.full_name for person in people])
+    row_totals = row_totals.tolist()
+    total_sum_score = sum(row_totals) // 2
 
     for i in range(n):
-        total_score = sum(compatibility_matrix[i])
+        total_score = row_totals[i]
         recommendation = generate_recommendation(total_score, total_sum_score)
         results.append(GroupCompatibilityResult(
-            full_name=people_data[i]['person'].full_name,
+            full_name=people[i].full_name,
             total_score=total_score,
             recommendation=recommendation
         ))
@@ -300,42 +154,187 @@ async def calculate_group_compatibility(people_data: List[Dict]) -> Tuple[List[G
 
 
 @app.post("/api/cosmostat/two-people")
-async def get_compatibility_for_two(request: TwoPeopleCompatibilityRequest):
+async def get_compatibility_for_two(request: TwoPeopleCompatibilityRequest,
+                                    explain: Literal["text", "codes"] = "text",
+                                    accept_language: Optional[str] = Header(None)):
+    set_department_size(2)
     try:
-        elements1, behaviors1, astrology1 = await get_real_data(request.person1)
-        elements2, behaviors2, astrology2 = await get_real_data(request.person2)
-        result = await calculate_compatibility(elements1, elements2, behaviors1, behaviors2, astrology1, astrology2)
-        return {
+        profile1, profile2 = await asyncio.gather(get_real_data(request.person1), get_real_data(request.person2))
+        result = render_result(
+            await cached_compatibility(profile1, profile2),
+            pick_language(accept_language),
+            codes_only=explain == "codes"
+        )
+        response = {
             "isSuccess": True,
             "errorMessage": None,
             "errorCode": 0,
             "data": result
         }
+        if (request.detail or TWO_PEOPLE_DETAIL) == DETAIL_FULL:
+            response["data"] = {**asdict(result), "frames": await get_extra_frames([request.person1, request.person2])}
+        return response
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/api/cosmostat/department")
 async def get_compatibility_for_department(request: DepartmentCompatibilityRequest):
+    set_department_size(len(request.people))
     try:
-        people_data = []
-        for person in request.people:
-            elements, behaviors, astrology = await get_real_data(person)
-            people_data.append({
-                'person': person,
-                'elements': elements,
-                'behaviors': behaviors,
-                'astrology': astrology
-            })
-        results, compatibility_matrix = await calculate_group_compatibility(people_data)
-        return {
+        profiles = await get_profiles(request.people)
+        results, compatibility_matrix = await calculate_group_compatibility(request.people, profiles, request.top_k)
+        response = {
             "isSuccess": True,
             "errorMessage": None,
             "errorCode": 0,
             "data": {
             "results": results, 
-            "compatibility_matrix": compatibility_matrix
+            "compatibility_matrix" if request.top_k is None else "partners": compatibility_matrix
             }
                 
         }
+        if (request.detail or DEPARTMENT_DETAIL) == DETAIL_FULL:
+            response["data"]["frames"] = await get_extra_frames(request.people)
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/api/cosmostat/department/stream")
+async def stream_compatibility_for_department(request: DepartmentCompatibilityRequest,
+                                              format: Literal["ndjson", "sse"] = "ndjson"):
+    """
+    Потоковый вариант /api/cosmostat/department: строки матрицы отдаются по мере расчёта
+    (события row), затем рекомендации (события result) и итог (событие done).
+    """
+    set_department_size(len(request.people))
+    try:
+        profiles = await get_profiles(request.people)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        try:
+            row_totals = []
+            async for i, row in stream_rows(pack_profiles(profiles)):
+                total_score = int(row.sum())
+                row_totals.append(total_score)
+                yield encode_event({
+                    "type": "row",
+                    "index": i,
+                    "full_name": request.people[i].full_name,
+                    "total_score": total_score,
+                    "row": row.tolist()
+                }, format)
+                await asyncio.sleep(0)
+            total_sum_score = sum(row_totals) // 2
+            for i, total_score in enumerate(row_totals):
+                yield encode_event({
+                    "type": "result",
+                    "index": i,
+                    "full_name": request.people[i].full_name,
+                    "total_score": total_score,
+                    "recommendation": generate_recommendation(total_score, total_sum_score)
+                }, format)
+            yield encode_event({"type": "done", "total_sum_score": total_sum_score}, format)
+        except Exception as e:
+            yield encode_event({"type": "error", "errorMessage": str(e)}, format)
+
+    return StreamingResponse(events(), media_type=MEDIA_TYPES[format])
+
+
+async def department_state_response(department: Department, include_matrix: bool = False):
+    set_department_size(len(department))
+    totals = department.totals()
+    results = [
+        GroupCompatibilityResult(
+            full_name=person.full_name,
+            total_score=total_score,
+            recommendation=generate_recommendation(total_score, department.total_sum_score)
+        )
+        for person, total_score in zip(department.people, totals)
+    ]
+    data = {
+        "department_id": department.department_id,
+        "members": department.members(),
+        "results": results,
+        "total_sum_score": department.total_sum_score
+    }
+    if include_matrix:
+        data["compatibility_matrix"] = department.compatibility_matrix()
+    return {
+        "isSuccess": True,
+        "errorMessage": None,
+        "errorCode": 0,
+        "data": data
+    }
+
+
+@app.post("/api/cosmostat/departments")
+async def create_department_state(request: DepartmentCompatibilityRequest):
+    set_department_size(len(request.people))
+    try:
+        profiles = await get_profiles(request.people)
+        department = await create_department(request.people, profiles)
+        return await department_state_response(department, include_matrix=True)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/cosmostat/departments/{department_id}")
+async def get_department_state(department_id: str):
+    try:
+        department = get_department(department_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Department not found")
+    return await department_state_response(department, include_matrix=True)
+
+
+@app.post("/api/cosmostat/departments/{department_id}/members")
+async def add_department_member(department_id: str, person: PersonInfo):
+    try:
+        department = get_department(department_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Department not found")
+    set_department_size(len(department) + 1)
+    try:
+        department.add_member(person, await get_real_data(person))
+        return await department_state_response(department)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.delete("/api/cosmostat/departments/{department_id}/members/{member_id}")
+async def remove_department_member(department_id: str, member_id: str):
+    try:
+        department = get_department(department_id)
+        department.remove_member(member_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Department or member not found")
+    return await department_state_response(department)
+
+
+@app.get("/api/cosmostat/cache")
+async def get_cache_stats():
+    return {
+        "isSuccess": True,
+        "errorMessage": None,
+        "errorCode": 0,
+        "data": {
+            "profiles": profile_cache_stats(),
+            "stored_profiles": stored_profiles.stats(),
+            "frames": frames_cache.stats(),
+            "pairs": pair_cache.stats()
+        }
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(
+        render_metrics({
+            "profiles": profile_cache_stats(), "stored_profiles": stored_profiles.stats(),
+            "frames": frames_cache.stats(), "pairs": pair_cache.stats()
+        }),
+        media_type="text/plain; version=0.0.4"
+    )
@@ -1,20 +1,47 @@
-import json
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Tuple
-import requests
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import List, Tuple, Optional, Literal
 import random
-from dataclasses import dataclass
-import httpx
+import asyncio
+from dataclasses import dataclass, asdict, replace
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import os
 
+from profiles import (
+    Profile, get_profile, get_profiles, get_extra_frames, profile_cache_stats, stored_profiles, frames_cache,
+    open_upstream_client, close_upstream_client, check_provider, DETAIL_FULL
+)
+from profile_store import load_profile_store
+from scoring import cached_compatibility, render_result, pair_cache
+from matrix_pool import score_department, department_partners, stream_rows, close_matrix_pool
+from explanations import pick_language
+from metrics import MetricsMiddleware, set_department_size, render_metrics
+from profiling import ProfilingMiddleware
+from compat_matrix import pack_profiles
+from streaming import encode_event, MEDIA_TYPES
+from departments import Department, create_department, get_department
+from gigachat import chat_completion, message_content, score_skills, skills_matrix, close_gigachat_client, gigachat_breaker
+from settings import TWO_PEOPLE_DETAIL, DEPARTMENT_DETAIL, RECOMMENDATION_CONCURRENCY, RECOMMENDATION_BUDGET
+
 load_dotenv()
-RQUID = os.getenv('RQUID')
-AUTHKEY = os.getenv('AUTHKEY')
 ISONGPT = os.getenv('ISONGPT')
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    check_provider()
+    load_profile_store()
+    await open_upstream_client()
+    yield
+    await close_upstream_client()
+    close_matrix_pool()
+    await close_gigachat_client()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 class PersonInfo(BaseModel):
     full_name: str
@@ -24,15 +51,14 @@ class PersonInfo(BaseModel):
 class TwoPeopleCompatibilityRequest(BaseModel):
     person1: PersonInfo
     person2: PersonInfo
+    detail: Optional[Literal["astro", "full"]] = None
 
 class DepartmentCompatibilityRequest(BaseModel):
     people: List[PersonInfo]
-
-@dataclass
-class CompatibilityResult:
-    total_score: int
-    compatibility_level: str
-    explanations: Dict[str, List[str]]
+    detail: Optional[Literal["astro", "full"]] = None
+    # Вместо полной матрицы вернуть top_k лучших и худших партнёров каждого сотрудника.
+    top_k: Optional[int] = Field(None, ge=1)
+    skills_matrix: bool = False
 
 @dataclass
 class GroupCompatibilityResult:
@@ -82,204 +108,56 @@ MOTIVATIONAL_RECOMMENDATIONS = [
     "Внедрите системы поощрения за долгосрочное сотрудничество."
 ]
 
-async def analyze_elements(elements1: Dict[str, float], elements2: Dict[str, float]):
-    score = 0
-    explanation = []
-    for element in ["Огонь", "Земля", "Воздух", "Вода"]:
-        if elements1[element] > 40 and elements2[element] > 40:
-            score -= 2
-            explanation.append(f"- Обе стороны имеют доминирующую стихию {element}, это может привести к однотипному подходу и конфликтам.")
-        elif abs(elements1[element] - elements2[element]) < 20:
-            score += 2
-            explanation.append(f"+ Стихия {element} сбалансирована между людьми, что способствует гармонии.")
-        else:
-            explanation.append(f"- Стихия {element} несбалансирована: {elements1[element]:.1f}% у одного, {elements2[element]:.1f}% у другого.")
-    dominant_elements1 = sum(1 for v in elements1.values() if v > 40)
-    dominant_elements2 = sum(1 for v in elements2.values() if v > 40)
-    if dominant_elements1 == 0 and dominant_elements2 == 0:
-        score += 3
-        explanation.append("+ У обоих нет доминирующей стихии, что способствует гибкости и адаптивности.")
-    elif dominant_elements1 > 1 or dominant_elements2 > 1:
-        score -= 3
-        explanation.append("- У одного из участников доминирует несколько стихий, что может усложнить взаимодействие.")
-    return score, explanation
-
-async def analyze_behaviors(behaviors1: Dict[str, float], behaviors2: Dict[str, float]):
-    score = 0
-    explanation = []
-    for strategy in ["Кардинальность", "Фиксированность", "Мутабельность"]:
-        if behaviors1[strategy] > 40 and behaviors2[strategy] > 40:
-            score -= 2
-            explanation.append(f"- Оба имеют доминирующую стратегию {strategy}, что может привести к столкновению интересов.")
-        elif abs(behaviors1[strategy] - behaviors2[strategy]) < 20:
-            score += 3
-            explanation.append(f"+ Стратегия {strategy} уравновешена между участниками, это улучшает совместимость.")
-        else:
-            explanation.append(f"- Различия в стратегии {strategy} могут вызывать недопонимание (у одного {behaviors1[strategy]:.1f}%, у другого {behaviors2[strategy]:.1f}%).")
-    dominant_strategies1 = sum(1 for v in behaviors1.values() if v > 40)
-    dominant_strategies2 = sum(1 for v in behaviors2.values() if v > 40)
-    if dominant_strategies1 == 1 and dominant_strategies2 == 1:
-        score += 2
-        explanation.append("+ У обоих участников доминирует только одна стратегия, что способствует сосредоточенности.")
-    elif dominant_strategies1 > 1 or dominant_strategies2 > 1:
-        score -= 2
-        explanation.append("- У одного из участников слишком много доминирующих стратегий, что может усложнить взаимодействие.")
-    return score, explanation
-
-async def analyze_astrology(astrology1: Dict[str, str], astrology2: Dict[str, str]):
-    score = 0
-    explanation = []
-    if astrology1["Солнце"] == astrology2["Луна"] or astrology2["Солнце"] == astrology1["Луна"]:
-        score += 3
-        explanation.append("+ Солнце и Луна гармонируют, это улучшает эмоциональную совместимость.")
-    else:
-        score -= 1
-        explanation.append("- Солнце и Луна не гармонируют, возможны эмоциональные разногласия.")
-    if astrology1["Венера"] == astrology2["Марс"] or astrology2["Венера"] == astrology1["Марс"]:
-        score += 2
-        explanation.append("+ Венера и Марс гармонируют, это улучшает социальные и профессиональные отношения.")
-    else:
-        score -= 2
-        explanation.append("- Венера и Марс не гармонируют, возможны трудности в личных и рабочих взаимодействиях.")
-    if astrology1["Солнце"][:1] == astrology2["Солнце"][:1]:
-        score += 2
-        explanation.append("+ Солнце в знаках одной стихии, это улучшает понимание и общие цели.")
-    else:
-        explanation.append("- Солнце в разных стихиях, возможны разногласия в подходе к задачам.")
-    return score, explanation
-
-async def calculate_compatibility(elements1, elements2, behaviors1, behaviors2, astrology1, astrology2):
-    element_score, element_explanation = await analyze_elements(elements1, elements2)
-    behavior_score, behavior_explanation = await analyze_behaviors(behaviors1, behaviors2)
-    astrology_score, astrology_explanation = await analyze_astrology(astrology1, astrology2)
-
-    total_score = element_score + behavior_score + astrology_score
-    if total_score >= 8:
-        level = "Высокая совместимость"
-    elif 4 <= total_score < 8:
-        level = "Средняя совместимость"
-    else:
-        level = "Низкая совместимость"
-    explanations = {
-        "Стихии": element_explanation,
-        "Стратегии поведения": behavior_explanation,
-        "Астрология": astrology_explanation,
-    }
-    return CompatibilityResult(total_score=total_score, compatibility_level=level, explanations=explanations)
-
+async def get_real_data(person: PersonInfo) -> Profile:
+    return await get_profile(person.birth_date, person.full_name)
 
-def map_planet_to_sign(sign_index):
-    signs = ["Овен", "Телец", "Близнецы", "Рак", "Лев", "Дева", "Весы", "Скорпион", "Стрелец", "Козерог", "Водолей", "Рыбы"]
-    if 0 <= sign_index < len(signs):
-        return signs[sign_index]
-    else:
-        return "Неизвестно"
 
-
-async def get_real_data(person: PersonInfo):
-    url = "https://www.lifexpert.ru/jui/rpc/"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    date_str = person.birth_date
-    payload = [
-        {
-            "jsonrpc": "2.0",
-            "id": 53,
-            "method": "datetime_calcs.astro_frame",
-            "params": {
-                "date": date_str,
-                "coord": {
-                    "lat": 59.9503,
-                    "lng": 30.3903,
-                    "country": "RU",
-                    "verbose": "Центральный р-н, Санкт-Петербург"
-                },
-                "options": {
-                    "houses_system": "K",
-                    "use_aspect_node": False,
-                    "use_aspect_lilith": False
-                }
-            }
-        },
-        {
-            "jsonrpc": "2.0",
-            "id": 54,
-            "method": "datetime_calcs.destinywill",
-            "params": {
-                "date": date_str
-            }
-        },
-        {
-            "jsonrpc": "2.0",
-            "id": 55,
-            "method": "datetime_calcs.pifagor_frame",
-            "params": {
-                "date": date_str,
-                "death_date": None,
-                "fio": [],
-                "use_1999": False
-            }
-        }
-    ]
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 200:
-        data = response.json()
-        if not data or 'result' not in data[0]:
-            raise Exception(f"Invalid data received for {person.full_name}")
-        astro_frame = data[0]['result']
-        elements_data = astro_frame['elements']
-        elements = {
-            "Огонь": elements_data['elements']['fire'] * 100,
-            "Земля": elements_data['elements']['earth'] * 100,
-            "Воздух": elements_data['elements']['air'] * 100,
-            "Вода": elements_data['elements']['water'] * 100
-        }
-        behaviors = {
-            "Кардинальность": elements_data['strategy']['cardinal'] * 100,
-            "Фиксированность": elements_data['strategy']['constant'] * 100,
-            "Мутабельность": elements_data['strategy']['mutable'] * 100
-        }
-        planets = astro_frame['planets']
-        astrology = {}
-        for planet_name in ["sun", "moon", "venus", "mars", "jupiter", "saturn"]:
-            if planet_name in planets and len(planets[planet_name]) > 1:
-                sign_index = planets[planet_name][1]
-                astrology_name = {
-                    "sun": "Солнце",
-                    "moon": "Луна",
-                    "venus": "Венера",
-                    "mars": "Марс",
-                    "jupiter": "Юпитер",
-                    "saturn": "Сатурн"
-                }[planet_name]
-                astrology[astrology_name] = map_planet_to_sign(sign_index)
-            else:
-                astrology[astrology_name] = "Неизвестно"
-        return elements, behaviors, astrology
-    else:
-        raise Exception(f"API request failed with status code {response.status_code}")
+GOOD_LEVEL_RECOMMENDATION = "Рекомендация: Сотрудник показывает хороший уровень. Продолжайте поддерживать текущую мотивацию и развитие."
 
 
-async def generate_recommendation(score: int, average_score: float) -> str:
+async def generate_recommendations(scores: List[int], average_score: float) -> List[str]:
     """
-    Генерирует рекомендацию на основе сравнения балла сотрудника со средним баллом группы.
+    Генерирует рекомендации для всех сотрудников группы.
+
+    Запросы к GigaChat идут параллельно, не больше RECOMMENDATION_CONCURRENCY одновременно,
+    и для одинаковых баллов выполняются один раз. Кто не получил ответ за RECOMMENDATION_BUDGET
+    секунд или получил ошибку, получает рекомендацию из MOTIVATIONAL_RECOMMENDATIONS; пока gigachat_breaker
+    разомкнут, GigaChat не вызывается.
 
-    :param score: Балл сотрудника
+    :param scores: Баллы сотрудников
     :param average_score: Средний балл группы
-    :return: Строка с рекомендацией
+    :return: Рекомендации в порядке scores
     """
-    if score < int(average_score):
-        if ISONGPT == "True":
-            recommendation = await get_hr_recommendation(score, average_score)
-            if recommendation == '':
-                recommendation = random.choice(MOTIVATIONAL_RECOMMENDATIONS)
-        else:
-            print(123)
+    threshold = int(average_score)
+    calls = {}
+    if ISONGPT == "True" and not gigachat_breaker.is_open():
+        semaphore = asyncio.Semaphore(RECOMMENDATION_CONCURRENCY)
+
+        async def limited(score: int) -> str:
+            async with semaphore:
+                return await get_hr_recommendation(score, average_score)
+
+        # Промпт зависит только от int(score) и int(average_score).
+        calls = {score: asyncio.ensure_future(limited(score)) for score in {int(score) for score in scores if score < threshold}}
+        if calls:
+            _, pending = await asyncio.wait(calls.values(), timeout=RECOMMENDATION_BUDGET)
+            for task in pending:
+                task.cancel()
+
+    recommendations = []
+    for score in scores:
+        if score >= threshold:
+            recommendations.append(GOOD_LEVEL_RECOMMENDATION)
+            continue
+        recommendation = ''
+        task = calls.get(int(score))
+        if task is not None and task.done() and not task.cancelled() and task.exception() is None:
+            recommendation = task.result()
+        if recommendation == '':
             recommendation = random.choice(MOTIVATIONAL_RECOMMENDATIONS)
-        return f"Рекомендация: {recommendation}"
-    else:
-        return "Рекомендация: Сотрудник показывает хороший уровень. Продолжайте поддерживать текущую мотивацию и развитие."
+        recommendations.append(f"Рекомендация: {recommendation}")
+    return recommendations
+
 
 async def get_hr_recommendation(user_score: int, avg_score: int) -> str:
     """
@@ -289,217 +167,262 @@ async def get_hr_recommendation(user_score: int, avg_score: int) -> str:
     :param avg_score: Средний балл в отделе.
     :return: Рекомендация от GigaChat максимум 7 слов.
     """
-    token_object = get_token()
-    access_token = token_object['access_token']
     input_text = f"Балл сотрудника: {int(user_score)}; Средний балл отдела: {int(avg_score)}."
-    
-    url = 'https://gigachat.devices.sberbank.ru/api/v1/chat/completions'
-
-    payload = json.dumps({
-        "model": "GigaChat",
-        'messages': [
-            {'role': 'system', 'content': 'Создать краткую маркетинговую рекомендацию для HR на русском языке конкретно для помощи текущему сотруднику. Максимальная длина – 10 слов.'},
-            {'role': 'user', 'content': input_text}
-        ],
-        "temperature": 0.1,
-        "top_p": 0.1,
-        "n": 1,
-        "stream": False,
-        "max_tokens": 30,
-        "repetition_penalty": 1
-    })
-
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'Authorization': f'Bearer {access_token}'
-    }
 
-    async with httpx.AsyncClient(verify="chain.pem") as client:
-        response = await client.post(url, headers=headers, data=payload)
+    response = await chat_completion([
+        {'role': 'system', 'content': 'Создать краткую маркетинговую рекомендацию для HR на русском языке конкретно для помощи текущему сотруднику. Максимальная длина – 10 слов.'},
+        {'role': 'user', 'content': input_text}
+    ], temperature=0.1, max_tokens=30)
 
     if response.status_code == 200:
-        data = response.json()
-        try:
-            message = data['choices'][0]['message']['content']
-            return message
-        except (KeyError, IndexError):
+        message = message_content(response)
+        if message is None:
             return "Ошибка обработки ответа."
+        return message
     else:
         return f"Ошибка запроса: {response.status_code}."
 
 
-async def calculate_group_compatibility(people_data: List[Dict]) -> Tuple[List[GroupCompatibilityResult], List[List[int]]]:
+async def calculate_group_compatibility(people: List[PersonInfo], profiles: List[Profile],
+                                        top_k: Optional[int] = None) -> Tuple[List[GroupCompatibilityResult], List]:
     """
     Рассчитывает совместимость группы сотрудников и возвращает результаты с рекомендациями и матрицу совместимости.
 
-    :param people_data: Список данных о сотрудниках.
-    :return: Кортеж из списка результатов и матрицы совместимости.
+    :param people: Список сотрудников.
+    :param profiles: Профили сотрудников в том же порядке.
+    :param top_k: Если задан, вместо матрицы возвращаются top_k лучших и худших партнёров каждого сотрудника;
+        матрица n×n при этом целиком в памяти не хранится.
+    :return: Кортеж из списка результатов и матрицы совместимости (или списка партнёров).
     """
-    n = len(people_data)
-    results = []
-    compatibility_matrix = [[0 for _ in range(n)] for _ in range(n)]
-
-    total_sum_score = 0
-    for i in range(n):
-        for j in range(i + 1, n):
-            compatibility = await calculate_compatibility(
-                people_data[i]['elements'], people_data[j]['elements'],
-                people_data[i]['behaviors'], people_data[j]['behaviors'],
-                people_data[i]['astrology'], people_data[j]['astrology']
-            )
-            compatibility_score = compatibility.total_score
-            compatibility_matrix[i][j] = compatibility_score
-            compatibility_matrix[j][i] = compatibility_score
-            total_sum_score += compatibility_score
-
-    for i in range(n):
-        total_score = sum(compatibility_matrix[i])
-        recommendation = await generate_recommendation(total_score, total_sum_score)
-        results.append(GroupCompatibilityResult(
-            full_name=people_data[i]['person'].full_name,
-            total_score=total_score,
-            recommendation=recommendation
-        ))
+    if top_k is None:
+        matrix, row_totals = await score_department(profiles)
+        compatibility_matrix = matrix.tolist()
+    else:
+        partners = await department_partners(profiles, top_k)
+        row_totals = partners.row_totals
+        compatibility_matrix = partners.to_list([person.full_name for person in people])
+    row_totals = row_totals.tolist()
+    total_sum_score = sum(row_totals) // 2
+    recommendations = await generate_recommendations(row_totals, total_sum_score)
+
+    results = [
+        GroupCompatibilityResult(full_name=person.full_name, total_score=total_score, recommendation=recommendation)
+        for person, total_score, recommendation in zip(people, row_totals, recommendations)
+    ]
 
     return results, compatibility_matrix
 
 
-def get_token():
-    url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-
-    payload='scope=GIGACHAT_API_PERS'
-    headers = {
-    'Content-Type': 'application/x-www-form-urlencoded',
-    'Accept': 'application/json',
-    'RqUID': RQUID,
-    'Authorization': f'Basic {AUTHKEY}'
-    }
-
-    response = requests.request("POST", url, headers=headers, data=payload, verify='chain.pem')
-
-    return response.json()
-
-
 async def get_gigachat_score(person1: PersonInfo, person2: PersonInfo) -> int:
     """
     Retrieves the compatibility score from GigaChat based on the skills of two users.
 
     :param person1: First person's information including skills.
     :param person2: Second person's information including skills.
-    :return: An integer score between 0 and 10.
-    :raises Exception: If the API request fails or the response is invalid.
+    :return: An integer score between 0 and 10; 0 if GigaChat is disabled, unavailable or rejects the token request.
     """
 
-    if ISONGPT == "False":
+    if ISONGPT == "False" or gigachat_breaker.is_open():
         return 0
 
-    token_object = get_token()
-    access_token = token_object['access_token']
-    skills_user1 = person1.skills
-    skills_user2 = person2.skills
-    skills_text = f"User1: {', '.join(skills_user1)}; User2: {', '.join(skills_user2)};"
-
-    url = 'https://gigachat.devices.sberbank.ru/api/v1/chat/completions'
-
-    payload = json.dumps({
-        "model": "GigaChat",
-        'messages': [
-            {'role': 'system', 'content': 'Оценить совместимость двух наборов навыков для совместной работы по шкале от 0 до 10. Указать только балл совместимости.'},
-            {'role': 'user', 'content': skills_text}
-        ],
-        "temperature": 0.3,
-        "top_p": 0.1,
-        "n": 1,
-        "stream": False,
-        "max_tokens": 50,
-        "repetition_penalty": 1
-    })
-
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'Authorization': f'Bearer {access_token}'
-    }
-    
-
-    async with httpx.AsyncClient(verify="chain.pem") as client:
-        response = await client.post(url, headers=headers, data=payload )
-
-    print(response.status_code)
-    print(response.text)
-    if response.status_code == 200:
-        data = response.json()
-        try:
-            message = data['choices'][0]['message']['content']
-            score = int(message.strip())
-            if 0 <= score <= 10:
-                return score
-            else:
-                return 0
-        except (KeyError, IndexError, ValueError):
-            return 0
-    else:
-        return 0
+    return await score_skills(person1.skills, person2.skills)
 
 
 @app.post("/api/cosmostat/two-people")
-async def get_compatibility_for_two(request: TwoPeopleCompatibilityRequest):
+async def get_compatibility_for_two(request: TwoPeopleCompatibilityRequest,
+                                    explain: Literal["text", "codes"] = "text",
+                                    accept_language: Optional[str] = Header(None)):
+    set_department_size(2)
     try:
-        elements1, behaviors1, astrology1 = await get_real_data(request.person1)
-        elements2, behaviors2, astrology2 = await get_real_data(request.person2)
+        profile1, profile2 = await asyncio.gather(get_real_data(request.person1), get_real_data(request.person2))
 
 
-        result = await calculate_compatibility(
-            elements1, elements2,
-            behaviors1, behaviors2,
-            astrology1, astrology2
-        )
+        result = await cached_compatibility(profile1, profile2)
 
         gigachat_score = await get_gigachat_score(request.person1, request.person2)        
 
-        result.total_score = round(result.total_score + (gigachat_score / 3), 2)
-
-        if result.total_score >= 8:
-            level = "Высокая совместимость"
-        elif 4 <= result.total_score < 8:
-            level = "Средняя совместимость"
-        else:
-            level = "Низкая совместимость"
-        result.compatibility_level = level
+        result = render_result(
+            replace(result, total_score=round(result.total_score + (gigachat_score / 3), 2)),
+            pick_language(accept_language),
+            codes_only=explain == "codes"
+        )
 
-        return {
+        response = {
             "isSuccess": True,
             "errorMessage": None,
             "errorCode": 0,
             "data": result
         }
+        if (request.detail or TWO_PEOPLE_DETAIL) == DETAIL_FULL:
+            response["data"] = {**asdict(result), "frames": await get_extra_frames([request.person1, request.person2])}
+        return response
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/api/cosmostat/department")
 async def get_compatibility_for_department(request: DepartmentCompatibilityRequest):
+    set_department_size(len(request.people))
     try:
-        people_data = []
-        for person in request.people:
-            elements, behaviors, astrology = await get_real_data(person)
-            people_data.append({
-                'person': person,
-                'elements': elements,
-                'behaviors': behaviors,
-                'astrology': astrology
-            })
-        results, compatibility_matrix = await calculate_group_compatibility(people_data)
-        return {
+        profiles = await get_profiles(request.people)
+        results, compatibility_matrix = await calculate_group_compatibility(request.people, profiles, request.top_k)
+        response = {
             "isSuccess": True,
             "errorMessage": None,
             "errorCode": 0,
             "data": {
             "results": results, 
-            "compatibility_matrix": compatibility_matrix
+            "compatibility_matrix" if request.top_k is None else "partners": compatibility_matrix
             }
                 
         }
+        if (request.detail or DEPARTMENT_DETAIL) == DETAIL_FULL:
+            response["data"]["frames"] = await get_extra_frames(request.people)
+        if request.skills_matrix and ISONGPT == "True" and not gigachat_breaker.is_open():
+            matrix = await skills_matrix([person.skills for person in request.people])
+            response["data"]["skills_matrix"] = matrix.tolist()
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/api/cosmostat/department/stream")
+async def stream_compatibility_for_department(request: DepartmentCompatibilityRequest,
+                                              format: Literal["ndjson", "sse"] = "ndjson"):
+    """
+    Потоковый вариант /api/cosmostat/department: строки матрицы отдаются по мере расчёта
+    (события row), затем рекомендации (события result) и итог (событие done).
+    """
+    set_department_size(len(request.people))
+    try:
+        profiles = await get_profiles(request.people)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        try:
+            row_totals = []
+            async for i, row in stream_rows(pack_profiles(profiles)):
+                total_score = int(row.sum())
+                row_totals.append(total_score)
+                yield encode_event({
+                    "type": "row",
+                    "index": i,
+                    "full_name": request.people[i].full_name,
+                    "total_score": total_score,
+                    "row": row.tolist()
+                }, format)
+                await asyncio.sleep(0)
+            total_sum_score = sum(row_totals) // 2
+            recommendations = await generate_recommendations(row_totals, total_sum_score)
+            for i, (total_score, recommendation) in enumerate(zip(row_totals, recommendations)):
+                yield encode_event({
+                    "type": "result",
+                    "index": i,
+                    "full_name": request.people[i].full_name,
+                    "total_score": total_score,
+                    "recommendation": recommendation
+                }, format)
+            yield encode_event({"type": "done", "total_sum_score": total_sum_score}, format)
+        except Exception as e:
+            yield encode_event({"type": "error", "errorMessage": str(e)}, format)
+
+    return StreamingResponse(events(), media_type=MEDIA_TYPES[format])
+
+
+async def department_state_response(department: Department, include_matrix: bool = False):
+    set_department_size(len(department))
+    # Состояние снимается до ожидания рекомендаций: пока они генерируются, отдел могут изменить
+    # другие запросы, и на место удалённого сотрудника встанет последний.
+    people = list(department.people)
+    totals = department.totals()
+    total_sum_score = department.total_sum_score
+    data = {
+        "department_id": department.department_id,
+        "members": department.members(),
+        "results": None,
+        "total_sum_score": total_sum_score
+    }
+    if include_matrix:
+        data["compatibility_matrix"] = department.compatibility_matrix()
+    recommendations = await generate_recommendations(totals, total_sum_score)
+    data["results"] = [
+        GroupCompatibilityResult(full_name=person.full_name, total_score=total_score, recommendation=recommendation)
+        for person, total_score, recommendation in zip(people, totals, recommendations)
+    ]
+    return {
+        "isSuccess": True,
+        "errorMessage": None,
+        "errorCode": 0,
+        "data": data
+    }
+
+
+@app.post("/api/cosmostat/departments")
+async def create_department_state(request: DepartmentCompatibilityRequest):
+    set_department_size(len(request.people))
+    try:
+        profiles = await get_profiles(request.people)
+        department = await create_department(request.people, profiles)
+        return await department_state_response(department, include_matrix=True)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/cosmostat/departments/{department_id}")
+async def get_department_state(department_id: str):
+    try:
+        department = get_department(department_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Department not found")
+    return await department_state_response(department, include_matrix=True)
+
+
+@app.post("/api/cosmostat/departments/{department_id}/members")
+async def add_department_member(department_id: str, person: PersonInfo):
+    try:
+        department = get_department(department_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Department not found")
+    set_department_size(len(department) + 1)
+    try:
+        department.add_member(person, await get_real_data(person))
+        return await department_state_response(department)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.delete("/api/cosmostat/departments/{department_id}/members/{member_id}")
+async def remove_department_member(department_id: str, member_id: str):
+    try:
+        department = get_department(department_id)
+        department.remove_member(member_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Department or member not found")
+    return await department_state_response(department)
+
+
+@app.get("/api/cosmostat/cache")
+async def get_cache_stats():
+    return {
+        "isSuccess": True,
+        "errorMessage": None,
+        "errorCode": 0,
+        "data": {
+            "profiles": profile_cache_stats(),
+            "stored_profiles": stored_profiles.stats(),
+            "frames": frames_cache.stats(),
+            "pairs": pair_cache.stats()
+        }
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(
+        render_metrics({
+            "profiles": profile_cache_stats(), "stored_profiles": stored_profiles.stats(),
+            "frames": frames_cache.stats(), "pairs": pair_cache.stats()
+        }),
+        media_type="text/plain; version=0.0.4"
+    )
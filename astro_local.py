@@ -0,0 +1,258 @@
+"""
+Локальный расчёт astro_frame на Swiss Ephemeris вместо запроса к lifexpert.ru.
+
+Веса планет в долях стихий и стратегий подбираются по записанным ответам lifexpert.ru
+и хранятся в PLANET_WEIGHTS_PATH; пока файла нет, веса равные и расчёт не откалиброван.
+
+    python astro_local.py record dates.txt recorded.jsonl   # записать ответы lifexpert.ru
+    python astro_local.py fit recorded.jsonl                # подобрать веса в PLANET_WEIGHTS_PATH
+    python astro_local.py check recorded.jsonl [tolerance]  # проверить совпадение
+
+Каждая строка файла с ответами — {"date": ..., "coord": {...}, "response": <ответ RPC>},
+поле coord необязательно.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+import json
+import os
+import sys
+
+import numpy as np
+import swisseph as swe
+
+from settings import EPHE_PATH, BIRTH_TZ_OFFSET, PLANET_WEIGHTS_PATH
+
+if EPHE_PATH:
+    swe.set_ephe_path(EPHE_PATH)
+    CALC_FLAGS = swe.FLG_SWIEPH
+else:
+    CALC_FLAGS = swe.FLG_MOSEPH
+
+PLANETS = {
+    "sun": swe.SUN,
+    "moon": swe.MOON,
+    "mercury": swe.MERCURY,
+    "venus": swe.VENUS,
+    "mars": swe.MARS,
+    "jupiter": swe.JUPITER,
+    "saturn": swe.SATURN,
+    "uranus": swe.URANUS,
+    "neptune": swe.NEPTUNE,
+    "pluto": swe.PLUTO
+}
+
+
+def load_planet_weights(path: str) -> Dict[str, float]:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        weights = json.load(f)
+    return {name: float(weights.get(name, 0.0)) for name in PLANETS}
+
+
+# Вес планеты при подсчёте стихий и стратегий. Без подобранных весов расчёт не считается
+# равноценным lifexpert.ru и не подменяет его, когда lifexpert.ru недоступен.
+PLANET_WEIGHTS = load_planet_weights(PLANET_WEIGHTS_PATH)
+CALIBRATED = bool(PLANET_WEIGHTS)
+if not CALIBRATED:
+    PLANET_WEIGHTS = {name: 1.0 for name in PLANETS}
+
+# Знак i относится к стихии ELEMENTS[i % 4] и стратегии STRATEGIES[i % 3].
+ELEMENTS = ["fire", "earth", "air", "water"]
+STRATEGIES = ["cardinal", "constant", "mutable"]
+
+DATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M",
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y %H:%M",
+]
+DATE_ONLY_FORMATS = ["%Y-%m-%d", "%d.%m.%Y"]
+
+
+def parse_birth_date(date_str: str) -> datetime:
+    """
+    Разбирает дату рождения; если время не указано, берётся полдень.
+
+    :param date_str: Дата рождения.
+    :return: Момент рождения в UTC.
+    """
+    value = date_str.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            moment = datetime.strptime(value, fmt)
+            break
+        except ValueError:
+            continue
+    else:
+        for fmt in DATE_ONLY_FORMATS:
+            try:
+                moment = datetime.strptime(value, fmt).replace(hour=12)
+                break
+            except ValueError:
+                continue
+        else:
+            raise Exception(f"Unsupported birth date format: {date_str}")
+    return moment - timedelta(hours=BIRTH_TZ_OFFSET)
+
+
+def calculate_astro_frame(date_str: str, lat: float, lng: float) -> Dict:
+    """
+    Считает положения планет и доли стихий/стратегий в формате ответа datetime_calcs.astro_frame.
+
+    :param date_str: Дата рождения.
+    :param lat: Широта места рождения.
+    :param lng: Долгота места рождения.
+    :return: Словарь с ключами elements и planets.
+    """
+    moment = parse_birth_date(date_str)
+    jd = swe.julday(moment.year, moment.month, moment.day,
+                    moment.hour + moment.minute / 60 + moment.second / 3600)
+
+    planets = {}
+    elements = dict.fromkeys(ELEMENTS, 0.0)
+    strategy = dict.fromkeys(STRATEGIES, 0.0)
+    total_weight = sum(PLANET_WEIGHTS.values())
+    for name, planet in PLANETS.items():
+        longitude = swe.calc_ut(jd, planet, CALC_FLAGS)[0][0]
+        sign_index = int(longitude // 30) % 12
+        planets[name] = [longitude, sign_index, longitude - sign_index * 30]
+        weight = PLANET_WEIGHTS[name] / total_weight
+        elements[ELEMENTS[sign_index % 4]] += weight
+        strategy[STRATEGIES[sign_index % 3]] += weight
+
+    return {
+        "elements": {"elements": elements, "strategy": strategy},
+        "planets": planets,
+        "coord": {"lat": lat, "lng": lng}
+    }
+
+
+def compare_frames(local_frame: Dict, remote_frame: Dict, tolerance: float = 0.01) -> list:
+    """
+    Сравнивает локальный и записанный astro_frame.
+
+    :param tolerance: Допустимое расхождение долей стихий и стратегий.
+    :return: Список расхождений, пустой при совпадении.
+    """
+    mismatches = []
+    for group in ["elements", "strategy"]:
+        for key, remote_value in remote_frame['elements'][group].items():
+            local_value = local_frame['elements'][group].get(key, 0.0)
+            if abs(local_value - remote_value) > tolerance:
+                mismatches.append(f"{group}.{key}: local={local_value:.3f} remote={remote_value:.3f}")
+    for name, remote_planet in remote_frame['planets'].items():
+        if name in local_frame['planets'] and len(remote_planet) > 1:
+            local_sign = local_frame['planets'][name][1]
+            if local_sign != remote_planet[1]:
+                mismatches.append(f"planets.{name}: local={local_sign} remote={remote_planet[1]}")
+    return mismatches
+
+
+def read_recorded(path: str) -> Iterator[Dict]:
+    """
+    Читает записанные ответы; в поле frame — result ответа astro_frame.
+    """
+    from profiles import DEFAULT_COORD
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record["response"]
+            record["frame"] = response[0]["result"] if isinstance(response, list) else response
+            record["coord"] = record.get("coord") or DEFAULT_COORD
+            yield record
+
+
+def record_responses(dates_path: str, output_path: str) -> int:
+    """
+    Запрашивает astro_frame у lifexpert.ru для каждой даты из файла (по одной на строку) и дописывает ответы.
+
+    :return: Число дат, для которых ответ получить не удалось.
+    """
+    import httpx
+
+    from profiles import DEFAULT_COORD, build_payload
+    from settings import LIFEXPERT_URL
+
+    failed = 0
+    with open(dates_path, encoding="utf-8") as f:
+        dates = [line.strip() for line in f if line.strip()]
+    with open(output_path, "a", encoding="utf-8") as out, httpx.Client(timeout=30) as client:
+        for date_str in dates:
+            try:
+                response = client.post(LIFEXPERT_URL, json=build_payload(date_str, DEFAULT_COORD))
+                response.raise_for_status()
+                data = response.json()
+                if not data or "result" not in data[0]:
+                    raise ValueError("no result in response")
+            except (httpx.HTTPError, ValueError) as e:
+                failed += 1
+                print(f"{date_str}: {e}")
+                continue
+            out.write(json.dumps({"date": date_str, "coord": DEFAULT_COORD, "response": data}, ensure_ascii=False) + "\n")
+    print(f"Записано: {len(dates) - failed}, ошибок: {failed}")
+    return failed
+
+
+def fit_weights(path: str) -> Dict[str, float]:
+    """
+    Подбирает веса планет методом наименьших квадратов по записанным ответам.
+
+    Знаки планет берутся из самих ответов, поэтому погрешность эфемерид на веса не влияет:
+    доля стихии (стратегии) — сумма весов планет в знаках этой стихии (стратегии), сумма весов равна 1.
+    """
+    names = list(PLANETS)
+    rows: List[np.ndarray] = []
+    values: List[float] = []
+    for record in read_recorded(path):
+        frame = record["frame"]
+        signs = {name: frame["planets"][name][1] for name in names if len(frame["planets"].get(name, [])) > 1}
+        for group, keys, period in (("elements", ELEMENTS, 4), ("strategy", STRATEGIES, 3)):
+            for index, key in enumerate(keys):
+                rows.append(np.array([float(name in signs and signs[name] % period == index) for name in names]))
+                values.append(frame["elements"][group][key])
+    if not rows:
+        raise ValueError(f"No recorded responses in {path}")
+    # Условие «сумма весов равна 1» добавляется строкой с большим весом.
+    rows.append(np.full(len(names), 100.0))
+    values.append(100.0)
+    weights, *_ = np.linalg.lstsq(np.array(rows), np.array(values), rcond=None)
+    weights = np.clip(weights, 0, None)
+    weights /= weights.sum()
+    return dict(zip(names, weights.tolist()))
+
+
+def check_parity(path: str, tolerance: float = 0.01) -> int:
+    checked = failed = 0
+    for record in read_recorded(path):
+        coord = record["coord"]
+        local_frame = calculate_astro_frame(record["date"], coord["lat"], coord["lng"])
+        mismatches = compare_frames(local_frame, record["frame"], tolerance)
+        checked += 1
+        if mismatches:
+            failed += 1
+            print(f"{record['date']}: " + "; ".join(mismatches))
+    print(f"Проверено: {checked}, расхождений: {failed}" + ("" if CALIBRATED else " (веса не подобраны)"))
+    return failed
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "record" and len(sys.argv) == 4:
+        sys.exit(1 if record_responses(sys.argv[2], sys.argv[3]) else 0)
+    elif command == "fit" and len(sys.argv) == 3:
+        fitted = fit_weights(sys.argv[2])
+        with open(PLANET_WEIGHTS_PATH, "w", encoding="utf-8") as f:
+            json.dump(fitted, f, indent=2)
+        print(f"Веса записаны в {PLANET_WEIGHTS_PATH}: " + ", ".join(f"{name}={w:.3f}" for name, w in fitted.items()))
+    elif command == "check" and len(sys.argv) in (3, 4):
+        tolerance = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+        sys.exit(1 if check_parity(sys.argv[2], tolerance) else 0)
+    else:
+        print("Usage: python astro_local.py record dates.txt recorded.jsonl | fit recorded.jsonl | check recorded.jsonl [tolerance]")
+        sys.exit(2)
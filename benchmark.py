@@ -0,0 +1,261 @@
+"""
+Бенчмарки расчёта совместимости и эндпоинтов без доступа к внешним сервисам.
+
+Расчёт замеряется на синтетических профилях, эндпоинты — end to end: API запускается под uvicorn
+против заглушек lifexpert.ru и GigaChat из stubs.py. Результат пишется в JSON, два запуска
+сравниваются по медианам:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json
+    python benchmark.py --compare before.json after.json
+"""
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from compat_matrix import build_matrix, pack_profiles
+from profiles import Profile, SIGNS
+from scoring import calculate_compatibility, score_pair, score_matrix, pair_cache
+from stubs import start_stubs, start_app, stop_process
+
+MAX_SAMPLED_PAIRS = 20000
+
+
+def random_profile(rng: random.Random) -> Profile:
+    elements = [rng.random() for _ in range(4)]
+    strategies = [rng.random() for _ in range(3)]
+    return Profile(
+        tuple(value / sum(elements) * 100 for value in elements),
+        tuple(value / sum(strategies) * 100 for value in strategies),
+        tuple(rng.randrange(len(SIGNS) - 1) for _ in range(6))
+    )
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+        "repeat": len(samples)
+    }
+
+
+def measure(func: Callable[[], object], repeat: int, setup: Callable[[], object] = None) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def benchmark_scoring(sizes: List[int], repeat: int, seed: int) -> List[Dict]:
+    results = []
+    for n in sizes:
+        rng = random.Random(seed + n)
+        profiles = [random_profile(rng) for _ in range(n)]
+        # Отдел, где на каждый уникальный профиль приходится около десяти сотрудников.
+        duplicated = [profiles[rng.randrange(max(n // 10, 1))] for _ in range(n)]
+        pairs = list(itertools.islice(itertools.combinations(profiles, 2), MAX_SAMPLED_PAIRS))
+
+        async def analyzers():
+            for profile1, profile2 in pairs:
+                await calculate_compatibility(profile1, profile2)
+
+        def pairwise():
+            for profile1, profile2 in pairs:
+                score_pair(profile1, profile2)
+
+        arrays = pack_profiles(profiles)
+        cases = [
+            ("analyzers", lambda: asyncio.run(analyzers()), None, len(pairs)),
+            ("score_pair", pairwise, None, len(pairs)),
+            ("build_matrix", lambda: build_matrix(arrays), None, n * n),
+            ("score_matrix", lambda: score_matrix(profiles), pair_cache.clear, n * n),
+            ("score_matrix_duplicates", lambda: score_matrix(duplicated), pair_cache.clear, n * n),
+        ]
+        for name, func, setup, pair_count in cases:
+            seconds = measure(func, repeat, setup)
+            results.append({
+                "section": "scoring",
+                "name": name,
+                "n": n,
+                "pairs": pair_count,
+                "seconds": seconds,
+                "per_pair_ns": seconds["median"] / pair_count * 1e9
+            })
+            print(f"scoring {name} n={n}: {seconds['median'] * 1000:.2f} мс", file=sys.stderr)
+    return results
+
+
+class BirthDates:
+    """
+    Выдаёт даты рождения, которые ещё не запрашивались: так запросы попадают мимо кэша профилей.
+    """
+
+    def __init__(self):
+        self.next_date = date(1940, 1, 1)
+
+    def take(self, count: int) -> List[str]:
+        dates = [(self.next_date + timedelta(days=i)).isoformat() for i in range(count)]
+        self.next_date += timedelta(days=count)
+        return dates
+
+
+def people(birth_dates: List[str]) -> List[Dict]:
+    return [
+        {"full_name": f"Сотрудник {i}", "birth_date": birth_date, "skills": ["python", "sql"] if i % 2 else ["excel"]}
+        for i, birth_date in enumerate(birth_dates)
+    ]
+
+
+def pair_body(pair: List[Dict]) -> Dict:
+    return {"person1": pair[0], "person2": pair[1]}
+
+
+async def measure_requests(client: httpx.AsyncClient, url: str, make_body: Callable[[], Dict], repeat: int) -> Dict:
+    samples = []
+    statuses = {}
+    for _ in range(repeat):
+        body = make_body()
+        started = time.perf_counter()
+        response = await client.post(url, json=body)
+        samples.append(time.perf_counter() - started)
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    return {"seconds": summarize(samples), "status": statuses}
+
+
+async def benchmark_app(module: str, app_url: str, sizes: List[int], repeat: int) -> List[Dict]:
+    results = []
+    dates = BirthDates()
+    async with httpx.AsyncClient(base_url=app_url, timeout=600) as client:
+        warm_pair = pair_body(people(dates.take(2)))
+        cases = [
+            ("two-people", "/api/cosmostat/two-people", 2, "cold", lambda: pair_body(people(dates.take(2)))),
+            ("two-people", "/api/cosmostat/two-people", 2, "warm", lambda: warm_pair),
+        ]
+        for n in sizes:
+            warm_people = people(dates.take(n))
+            cases.append(("department", "/api/cosmostat/department", n, "cold",
+                          lambda n=n: {"people": people(dates.take(n))}))
+            cases.append(("department", "/api/cosmostat/department", n, "warm",
+                          lambda warm_people=warm_people: {"people": warm_people}))
+        for name, path, n, cache, make_body in cases:
+            if cache == "warm":
+                await client.post(path, json=make_body())
+            measured = await measure_requests(client, path, make_body, repeat)
+            results.append({"section": "endpoints", "app": module, "name": name, "n": n, "cache": cache, **measured})
+            print(f"{module} {name} n={n} {cache}: {measured['seconds']['median'] * 1000:.1f} мс", file=sys.stderr)
+    return results
+
+
+def benchmark_endpoints(modules: List[str], sizes: List[int], repeat: int,
+                        latency: float, gigachat_latency: float) -> List[Dict]:
+    results = []
+    stubs, stub_url = start_stubs(latency, gigachat_latency)
+    try:
+        for module in modules:
+            app, app_url = start_app(module, stub_url, {"ISONGPT": "True"})
+            try:
+                results.extend(asyncio.run(benchmark_app(module, app_url, sizes, repeat)))
+            finally:
+                stop_process(app)
+    finally:
+        stop_process(stubs)
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def result_key(result: Dict) -> tuple:
+    return result["section"], result.get("app", ""), result["name"], result["n"], result.get("cache", "")
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path, encoding="utf-8") as f:
+        before = {result_key(result): result for result in json.load(f)["results"]}
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)["results"]
+    for result in after:
+        old = before.get(result_key(result))
+        if old is None:
+            continue
+        old_median = old["seconds"]["median"]
+        new_median = result["seconds"]["median"]
+        label = " ".join(str(part) for part in result_key(result) if part != "")
+        print(f"{label}: {old_median * 1000:.2f} мс -> {new_median * 1000:.2f} мс (x{old_median / new_median:.2f})")
+
+
+def parse_sizes(value: str) -> List[int]:
+    return [int(size) for size in value.split(",") if size]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарки расчёта совместимости и эндпоинтов")
+    parser.add_argument("--sizes", type=parse_sizes, default=[10, 100, 1000, 5000], help="размеры отдела для расчёта")
+    parser.add_argument("--endpoint-sizes", type=parse_sizes, default=[10, 100, 1000], help="размеры отдела для эндпоинтов")
+    parser.add_argument("--apps", default="api_main_v3,api_main_v4", help="модули API через запятую")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка заглушки lifexpert.ru, с")
+    parser.add_argument("--gigachat-latency", type=float, default=0.2, help="задержка заглушки GigaChat, с")
+    parser.add_argument("--skip-scoring", action="store_true")
+    parser.add_argument("--skip-endpoints", action="store_true")
+    parser.add_argument("--output", help="файл для результатов; по умолчанию stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="сравнить два файла результатов")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    results = []
+    if not args.skip_scoring:
+        results.extend(benchmark_scoring(args.sizes, args.repeat, args.seed))
+    if not args.skip_endpoints:
+        results.extend(benchmark_endpoints(
+            [module for module in args.apps.split(",") if module], args.endpoint_sizes, args.repeat,
+            args.latency, args.gigachat_latency
+        ))
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key != "compare"}
+        },
+        "results": results
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,396 @@
+"""
+Сверки, которые подтверждают поведение оптимизаций: векторные и инкрементальные расчёты против
+прямого пересчёта, текст пояснений против исходных анализаторов api_main.py, хеджирование,
+выключатель и общие загрузки профилей. Внешние сервисы не нужны.
+
+    python checks.py                 # все сверки
+    python checks.py departments topk
+    python checks.py --list          # список сверок
+
+Код возврата 1, если хотя бы одна сверка не прошла.
+"""
+from typing import Callable, Dict, List
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+from compat_matrix import pack_profiles, build_matrix, top_partners
+from departments import Department
+from explanations import pick_language
+from profiles import (
+    Profile, SIGNS, UNKNOWN_SIGN, ELEMENT_KEYS, STRATEGY_KEYS, PLANET_KEYS, profile_key
+)
+from resilience import CircuitBreaker, UnavailableError, hedged
+from scoring import calculate_compatibility, cached_compatibility, render_result, score_pair, score_matrix, pair_cache
+
+CHECKS: Dict[str, Callable[[random.Random], str]] = {}
+
+
+def check(func: Callable[[random.Random], str]) -> Callable[[random.Random], str]:
+    CHECKS[func.__name__.replace("check_", "")] = func
+    return func
+
+
+def rounded_profile(rng: random.Random) -> Profile:
+    """
+    Случайный профиль с долями, округлёнными до 0,1 %, чтобы чаще попадать на пороги 40 и 20,
+    и с неизвестными знаками планет.
+    """
+    def shares(count: int):
+        values = [rng.random() ** 2 for _ in range(count)]
+        return tuple(round(value / sum(values) * 100, 1) for value in values)
+
+    signs = tuple(UNKNOWN_SIGN if rng.random() < 0.05 else rng.randrange(UNKNOWN_SIGN) for _ in range(6))
+    return Profile(shares(4), shares(3), signs)
+
+
+def profile_dicts(profile: Profile):
+    return (
+        dict(zip(ELEMENT_KEYS, profile.elements)),
+        dict(zip(STRATEGY_KEYS, profile.strategies)),
+        {planet: SIGNS[code] for planet, code in zip(PLANET_KEYS, profile.signs)}
+    )
+
+
+@check
+def check_scoring(rng: random.Random, pairs: int = 5000) -> str:
+    """
+    Profile и коды пояснений против исходных анализаторов на словарях из api_main.py:
+    балл, уровень и русский текст пояснений, в том числе для результата из pair_cache в обратном порядке.
+    """
+    import api_main
+
+    async def run():
+        pair_cache.clear()
+        for _ in range(pairs):
+            profile1, profile2 = rounded_profile(rng), rounded_profile(rng)
+            # Второй порядок пары берётся из pair_cache, где результат лежит для первого порядка.
+            for first, second in ((profile1, profile2), (profile2, profile1)):
+                elements1, behaviors1, astrology1 = profile_dicts(first)
+                elements2, behaviors2, astrology2 = profile_dicts(second)
+                expected = await api_main.calculate_compatibility(elements1, elements2, behaviors1, behaviors2, astrology1, astrology2)
+                expected = (expected.total_score, expected.compatibility_level, expected.explanations)
+                for result in (await calculate_compatibility(first, second), await cached_compatibility(first, second)):
+                    rendered = render_result(result)
+                    actual = (rendered.total_score, rendered.compatibility_level, rendered.explanations)
+                    assert actual == expected, f"{first} {second}: {actual} != {expected}"
+                assert score_pair(first, second) == expected[0], f"score_pair {first} {second}"
+
+    asyncio.run(run())
+    return f"{pairs} пар"
+
+
+@check
+def check_matrix(rng: random.Random) -> str:
+    """
+    build_matrix и score_matrix (с повторяющимися профилями) против score_pair.
+    """
+    for n in (1, 2, 11, 12, 40, 300):
+        profiles = [rounded_profile(rng) for _ in range(n)]
+        profiles = [profiles[rng.randrange(max(n // 3, 1))] if rng.random() < 0.3 else profile for profile in profiles]
+        expected = np.array([[0 if i == j else score_pair(p, q) for j, q in enumerate(profiles)] for i, p in enumerate(profiles)])
+        assert np.array_equal(build_matrix(pack_profiles(profiles), tile_size=7), expected), f"build_matrix n={n}"
+        pair_cache.clear()
+        assert np.array_equal(score_matrix(profiles), expected), f"score_matrix n={n}"
+    return "n = 1..300"
+
+
+@check
+def check_departments(rng: random.Random, steps: int = 500) -> str:
+    """
+    Инкрементальные добавления и удаления сотрудников против полного пересчёта.
+    """
+    class Person:
+        def __init__(self, full_name: str):
+            self.full_name = full_name
+
+    pool = [rounded_profile(rng) for _ in range(40)]
+    initial = [rng.choice(pool) for _ in range(5)]
+    department = Department([Person(f"p{i}") for i in range(len(initial))], initial)
+    profiles = dict(zip(department.member_ids, initial))
+    for step in range(steps):
+        if profiles and rng.random() < 0.45:
+            member_id = rng.choice(department.member_ids)
+            department.remove_member(member_id)
+            del profiles[member_id]
+        else:
+            profile = rng.choice(pool)
+            profiles[department.add_member(Person(f"s{step}"), profile)] = profile
+        expected = score_matrix([profiles[member_id] for member_id in department.member_ids])
+        assert department.compatibility_matrix() == expected.tolist(), f"matrix after step {step}"
+        assert department.totals() == expected.sum(axis=1).tolist(), f"totals after step {step}"
+        assert department.total_sum_score == int(expected.sum()) // 2, f"total_sum_score after step {step}"
+    return f"{steps} шагов, в конце {len(department)} сотрудников"
+
+
+def expected_partners(matrix: np.ndarray, k: int):
+    n = len(matrix)
+    rows = []
+    for i in range(n):
+        others = [j for j in range(n) if j != i]
+        rows.append((
+            sorted(others, key=lambda j: (-matrix[i, j], j))[:k],
+            sorted(others, key=lambda j: (matrix[i, j], j))[:k]
+        ))
+    return rows
+
+
+def assert_partners(partners, matrix: np.ndarray, k: int, label: str):
+    for i, (top, bottom) in enumerate(expected_partners(matrix, k)):
+        assert partners.top_index[i].tolist() == top, f"{label}: top of row {i}"
+        assert partners.bottom_index[i].tolist() == bottom, f"{label}: bottom of row {i}"
+    assert np.array_equal(partners.row_totals, matrix.sum(axis=1)), f"{label}: row totals"
+    assert np.array_equal(partners.top_score, np.take_along_axis(matrix, partners.top_index, axis=1)), f"{label}: top scores"
+
+
+@check
+def check_topk(rng: random.Random) -> str:
+    """
+    Лучшие и худшие партнёры по блокам строк против сортировки полной матрицы.
+    """
+    for n, k, tile_size in ((0, 3, 4), (1, 3, 4), (2, 5, 4), (7, 3, 3), (300, 5, 64), (300, 299, 256), (300, 1000, 7)):
+        arrays = pack_profiles([rounded_profile(rng) for _ in range(n)])
+        matrix = build_matrix(arrays).astype(np.int64)
+        assert_partners(top_partners(arrays, k, tile_size), matrix, min(k, max(n - 1, 0)), f"n={n} k={k}")
+    return "n = 0..300"
+
+
+@check
+def check_pool(rng: random.Random) -> str:
+    """
+    Расчёт отдела и потоковые строки в пуле процессов против расчёта в основном процессе.
+    """
+    import matrix_pool
+
+    unique = [rounded_profile(rng) for _ in range(300)]
+    cases = {"unique": unique, "duplicates": [rng.choice(unique[:100]) for _ in range(300)]}
+    min_size, workers = matrix_pool.MATRIX_POOL_MIN_SIZE, matrix_pool.MATRIX_POOL_WORKERS
+    matrix_pool.MATRIX_POOL_MIN_SIZE, matrix_pool.MATRIX_POOL_WORKERS = 50, 2
+    try:
+        for name, profiles in cases.items():
+            pair_cache.clear()
+            expected = score_matrix(profiles)
+            matrix, row_totals = asyncio.run(matrix_pool.score_department(profiles))
+            assert np.array_equal(matrix, expected), f"{name}: matrix"
+            assert np.array_equal(row_totals, expected.sum(axis=1)), f"{name}: row totals"
+            assert_partners(asyncio.run(matrix_pool.department_partners(profiles, 4)), expected.astype(np.int64), 4, name)
+
+            async def streamed():
+                return [(i, row.tolist()) async for i, row in matrix_pool.stream_rows(pack_profiles(profiles), tile_size=32)]
+
+            assert asyncio.run(streamed()) == list(enumerate(expected.tolist())), f"{name}: streamed rows"
+    finally:
+        matrix_pool.close_matrix_pool()
+        matrix_pool.MATRIX_POOL_MIN_SIZE, matrix_pool.MATRIX_POOL_WORKERS = min_size, workers
+    return "300 сотрудников, 2 процесса"
+
+
+@check
+def check_hedging(rng: random.Random) -> str:
+    """
+    resilience.hedged: дубль медленной попытки, повтор после ошибки, общий дедлайн.
+    """
+    async def run():
+        started = []
+
+        def attempt_with(delays: List[float], errors: List[bool]):
+            async def attempt():
+                index = len(started)
+                started.append(index)
+                await asyncio.sleep(delays[index])
+                if errors[index]:
+                    raise UnavailableError(f"attempt {index}")
+                return index
+            return attempt
+
+        started.clear()
+        assert await hedged(attempt_with([1.0, 0.01], [False, False]), 2, 0.05, 2) == 1, "slow attempt is hedged"
+        started.clear()
+        assert await hedged(attempt_with([0.0, 0.0], [True, False]), 2, 1.0, 2) == 1, "failed attempt is retried at once"
+        started.clear()
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+        try:
+            await hedged(attempt_with([5.0, 5.0], [False, False]), 0.2, 0.05, 2)
+            raise AssertionError("deadline is not enforced")
+        except UnavailableError:
+            assert loop.time() - begin < 0.5, "deadline overrun"
+        assert len(started) == 2, "attempts limit"
+        started.clear()
+        try:
+            await hedged(attempt_with([0.0, 0.0], [True, True]), 1, 0.05, 2)
+            raise AssertionError("last error is not raised")
+        except UnavailableError as e:
+            assert str(e) == "attempt 1", str(e)
+
+    asyncio.run(run())
+    return "4 сценария"
+
+
+@check
+def check_breaker(rng: random.Random) -> str:
+    """
+    CircuitBreaker: размыкание после порога, пропуск вызовов, повторное размыкание и замыкание.
+    """
+    async def run():
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.1)
+        calls = []
+
+        async def failing():
+            calls.append("fail")
+            raise UnavailableError("down")
+
+        async def working():
+            calls.append("ok")
+            return "ok"
+
+        async def call(func):
+            try:
+                return await breaker.call(func)
+            except UnavailableError:
+                return None
+
+        for _ in range(3):
+            await call(failing)
+        assert breaker.is_open() and breaker.trips == 1, breaker.stats()
+        assert await call(working) is None and calls.count("ok") == 0, "open breaker must not call the service"
+        await asyncio.sleep(0.12)
+        await call(failing)
+        assert breaker.is_open() and breaker.trips == 2, "first failure after reset_timeout reopens"
+        await asyncio.sleep(0.12)
+        assert await call(working) == "ok" and not breaker.is_open() and breaker.failures == 0, breaker.stats()
+
+    asyncio.run(run())
+    return "порог 3"
+
+
+@check
+def check_inflight(rng: random.Random) -> str:
+    """
+    Общие загрузки профилей: одна загрузка на ключ, отмена одного ожидающего
+    не прерывает остальных, ошибку получают все, запись в inflight_profiles удаляется.
+    """
+    import profiles
+
+    async def run():
+        loads = []
+        gate = asyncio.Event()
+
+        async def load():
+            loads.append(1)
+            await gate.wait()
+            return "profile"
+
+        key = ("check", 0, 0)
+        waiters = [asyncio.ensure_future(asyncio.shield(profiles.join_inflight(key, load))) for _ in range(20)]
+        await asyncio.sleep(0)
+        waiters[0].cancel()
+        gate.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert len(loads) == 1, f"{len(loads)} loads"
+        assert isinstance(results[0], asyncio.CancelledError) and results[1:] == ["profile"] * 19, results[:3]
+        assert key not in profiles.inflight_profiles, "finished load is not removed"
+
+        async def broken():
+            raise UnavailableError("down")
+
+        futures = [profiles.join_inflight(key, broken) for _ in range(5)]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        assert all(isinstance(result, UnavailableError) for result in results), results
+        assert len(set(map(id, futures))) == 1 and key not in profiles.inflight_profiles
+
+    asyncio.run(run())
+    return "20 ожидающих"
+
+
+@check
+def check_profile_store(rng: random.Random) -> str:
+    """
+    Хранилище профилей: дозапись после оборванной строки и загрузка в stored_profiles.
+    """
+    import profiles
+    from profile_store import append_store, load_profile_store
+
+    records = {profile_key(f"1990-01-{day:02d}"): rounded_profile(rng) for day in range(1, 29)}
+    items = list(records.items())
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "store.jsonl")
+        append_store(path, dict(items[:20]))
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"key": ["1990-02')
+        append_store(path, dict(items[20:]))
+        stored = dict(profiles.stored_profiles.items())
+        profiles.stored_profiles.clear()
+        try:
+            assert load_profile_store(path) == len(records), "records after a broken line are lost"
+            assert dict(profiles.stored_profiles.items()) == records
+            hits = profiles.stored_profiles.hits
+            assert all(profiles.cached_profile(key) == profile for key, profile in records.items())
+            assert profiles.stored_profiles.hits - hits == len(records), "stored profile hits are not counted"
+        finally:
+            profiles.stored_profiles.clear()
+            for key, profile in stored.items():
+                profiles.stored_profiles.set(key, profile)
+    return f"{len(records)} записей"
+
+
+@check
+def check_accept_language(rng: random.Random) -> str:
+    """
+    Выбор языка по Accept-Language с весами q.
+    """
+    cases = {
+        None: "ru",
+        "": "ru",
+        "en": "en",
+        "ru;q=0.1, en;q=0.9": "en",
+        "en-US,en;q=0.9,ru;q=0.8": "en",
+        "de, en;q=0.5, ru;q=0.4": "en",
+        "ru;q=0, en": "en",
+        "en;q=0, ru;q=0": "ru",
+        "fr;q=abc, en;q=0.2": "en",
+        "ru, en": "ru",
+        "en;q=0.5, ru;q=0.5": "en",
+    }
+    for header, expected in cases.items():
+        assert pick_language(header) == expected, f"{header!r}: {pick_language(header)} != {expected}"
+    return f"{len(cases)} заголовков"
+
+
+def run_checks(names: List[str], seed: int) -> int:
+    failed = 0
+    for name in names:
+        started = time.perf_counter()
+        try:
+            summary = CHECKS[name](random.Random(seed))
+        except Exception:
+            failed += 1
+            print(f"FAIL {name}", file=sys.stderr)
+            traceback.print_exc()
+            continue
+        print(f"ok   {name}: {summary}, {time.perf_counter() - started:.1f} с", file=sys.stderr)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сверки расчётов и механизмов устойчивости")
+    parser.add_argument("names", nargs="*", help="какие сверки запустить; по умолчанию все")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--list", action="store_true", help="показать список сверок")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, func in CHECKS.items():
+            print(f"{name}: {' '.join(func.__doc__.split())}")
+        sys.exit(0)
+    unknown = [name for name in args.names if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)}")
+    sys.exit(1 if run_checks(args.names or list(CHECKS), args.seed) else 0)
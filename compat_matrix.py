@@ -0,0 +1,242 @@
+"""
+Векторизованный расчёт матрицы совместимости отдела.
+
+Повторяет правила analyze_elements, analyze_behaviors и analyze_astrology на массивах NumPy
+и даёт те же целочисленные баллы. Сверка с поэлементным расчётом и замер скорости:
+
+    python compat_matrix.py [n]
+"""
+from dataclasses import dataclass
+from typing import Dict, List
+import numpy as np
+
+from profiles import Profile, SIGNS, SIGN_LETTERS, SUN, MOON, VENUS, MARS
+from settings import MATRIX_TILE_SIZE
+
+SIGN_LETTER_CODES = np.array([ord(letter) for letter in SIGN_LETTERS], dtype=np.int32)
+
+
+@dataclass
+class ProfileArrays:
+    elements: np.ndarray
+    strategies: np.ndarray
+    signs: np.ndarray
+
+    def __len__(self):
+        return len(self.elements)
+
+    def take(self, index) -> "ProfileArrays":
+        return ProfileArrays(self.elements[index], self.strategies[index], self.signs[index])
+
+
+def pack_profiles(profiles: List[Profile]) -> ProfileArrays:
+    """
+    Упаковывает профили в массивы n×4 (стихии), n×3 (стратегии) и n×6 (коды знаков).
+    """
+    return ProfileArrays(
+        np.array([profile.elements for profile in profiles], dtype=np.float64).reshape(len(profiles), 4),
+        np.array([profile.strategies for profile in profiles], dtype=np.float64).reshape(len(profiles), 3),
+        np.array([profile.signs for profile in profiles], dtype=np.int32).reshape(len(profiles), 6)
+    )
+
+
+def _pair_rules(values1: np.ndarray, values2: np.ndarray, balanced_bonus: int) -> np.ndarray:
+    dominant1 = values1 > 40
+    dominant2 = values2 > 40
+    score = np.zeros((len(values1), len(values2)), dtype=np.int32)
+    for k in range(values1.shape[1]):
+        both_dominant = dominant1[:, k, None] & dominant2[None, :, k]
+        balanced = np.abs(values1[:, k, None] - values2[None, :, k]) < 20
+        score += np.where(both_dominant, -2, np.where(balanced, balanced_bonus, 0))
+    return score
+
+
+def score_between(left: ProfileArrays, right: ProfileArrays) -> np.ndarray:
+    """
+    Считает баллы совместимости каждого профиля left с каждым профилем right.
+
+    :return: Матрица len(left)×len(right) типа int32.
+    """
+    score = _pair_rules(left.elements, right.elements, 2)
+    dominant1 = (left.elements > 40).sum(axis=1)[:, None]
+    dominant2 = (right.elements > 40).sum(axis=1)[None, :]
+    score += np.where((dominant1 == 0) & (dominant2 == 0), 3,
+                      np.where((dominant1 > 1) | (dominant2 > 1), -3, 0))
+
+    score += _pair_rules(left.strategies, right.strategies, 3)
+    dominant1 = (left.strategies > 40).sum(axis=1)[:, None]
+    dominant2 = (right.strategies > 40).sum(axis=1)[None, :]
+    score += np.where((dominant1 == 1) & (dominant2 == 1), 2,
+                      np.where((dominant1 > 1) | (dominant2 > 1), -2, 0))
+
+    signs1 = left.signs
+    signs2 = right.signs
+    sun_moon = (signs1[:, SUN, None] == signs2[None, :, MOON]) | (signs2[None, :, SUN] == signs1[:, MOON, None])
+    score += np.where(sun_moon, 3, -1)
+    venus_mars = (signs1[:, VENUS, None] == signs2[None, :, MARS]) | (signs2[None, :, VENUS] == signs1[:, MARS, None])
+    score += np.where(venus_mars, 2, -2)
+    same_letter = SIGN_LETTER_CODES[signs1[:, SUN]][:, None] == SIGN_LETTER_CODES[signs2[:, SUN]][None, :]
+    score += np.where(same_letter, 2, 0)
+    return score
+
+
+def score_rows(arrays: ProfileArrays, start: int, stop: int, zero_diagonal: bool = True) -> np.ndarray:
+    """
+    Считает строки start..stop матрицы совместимости.
+
+    :param zero_diagonal: Обнулить балл профиля с самим собой, как для одного и того же человека.
+    """
+    block = score_between(arrays.take(slice(start, stop)), arrays)
+    if zero_diagonal:
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = 0
+    return block
+
+
+def build_matrix(arrays: ProfileArrays, tile_size: int = MATRIX_TILE_SIZE, zero_diagonal: bool = True) -> np.ndarray:
+    """
+    Считает полную матрицу совместимости блоками по tile_size строк.
+
+    :return: Симметричная матрица n×n типа int32, по умолчанию с нулевой диагональю.
+    """
+    n = len(arrays)
+    matrix = np.empty((n, n), dtype=np.int32)
+    for start in range(0, n, tile_size):
+        stop = min(start + tile_size, n)
+        matrix[start:stop] = score_rows(arrays, start, stop, zero_diagonal)
+    return matrix
+
+
+def iter_rows(arrays: ProfileArrays, tile_size: int = MATRIX_TILE_SIZE):
+    """
+    Отдаёт строки матрицы совместимости по одной, держа в памяти только текущий блок строк.
+
+    :return: Генератор пар (номер строки, строка типа int32).
+    """
+    n = len(arrays)
+    for start in range(0, n, tile_size):
+        stop = min(start + tile_size, n)
+        block = score_rows(arrays, start, stop)
+        for offset in range(stop - start):
+            yield start + offset, block[offset]
+
+
+@dataclass
+class TopPartners:
+    """
+    Лучшие и худшие партнёры сотрудников: матрицы m×k номеров партнёров и их баллов
+    (лучшие по убыванию балла, худшие по возрастанию) и суммы баллов по строкам.
+    """
+    top_index: np.ndarray
+    top_score: np.ndarray
+    bottom_index: np.ndarray
+    bottom_score: np.ndarray
+    row_totals: np.ndarray
+
+    def to_list(self, names: List[str]) -> List[Dict]:
+        """
+        :param names: Имена сотрудников по номерам строк.
+        :return: Для каждого сотрудника списки top и bottom из номера, имени и балла партнёра.
+        """
+        def partners(index: np.ndarray, score: np.ndarray) -> List[Dict]:
+            return [{"index": j, "full_name": names[j], "score": value} for j, value in zip(index.tolist(), score.tolist())]
+
+        return [
+            {"full_name": names[i], "top": partners(self.top_index[i], self.top_score[i]),
+             "bottom": partners(self.bottom_index[i], self.bottom_score[i])}
+            for i in range(len(self.row_totals))
+        ]
+
+    @staticmethod
+    def concat(parts: List["TopPartners"]) -> "TopPartners":
+        return TopPartners(*(np.concatenate(arrays) for arrays in zip(*(
+            (part.top_index, part.top_score, part.bottom_index, part.bottom_score, part.row_totals) for part in parts
+        ))))
+
+
+def _largest(key: np.ndarray, k: int) -> np.ndarray:
+    if k == 0:
+        return np.empty((len(key), 0), dtype=np.intp)
+    index = np.argpartition(key, key.shape[1] - k, axis=1)[:, -k:]
+    order = np.argsort(np.take_along_axis(key, index, axis=1), axis=1)[:, ::-1]
+    return np.take_along_axis(index, order, axis=1)
+
+
+def top_partner_rows(arrays: ProfileArrays, start: int, stop: int, k: int) -> TopPartners:
+    """
+    Выбирает k лучших и k худших партнёров для строк start..stop, не сохраняя сами строки.
+
+    Сам сотрудник партнёром не считается; при равных баллах раньше идёт партнёр с меньшим номером.
+    """
+    n = len(arrays)
+    k = max(0, min(k, n - 1))
+    block = score_rows(arrays, start, stop).astype(np.int64)
+    rows = np.arange(stop - start)
+    columns = np.arange(n)
+    # Номер партнёра входит в ключ младшими разрядами, поэтому все ключи строки различны.
+    key = block * n - columns
+    key[rows, rows + start] = np.iinfo(np.int64).min
+    top_index = _largest(key, k)
+    key = -block * n - columns
+    key[rows, rows + start] = np.iinfo(np.int64).min
+    bottom_index = _largest(key, k)
+    return TopPartners(
+        top_index,
+        np.take_along_axis(block, top_index, axis=1).astype(np.int32),
+        bottom_index,
+        np.take_along_axis(block, bottom_index, axis=1).astype(np.int32),
+        block.sum(axis=1)
+    )
+
+
+def top_partners(arrays: ProfileArrays, k: int, tile_size: int = MATRIX_TILE_SIZE) -> TopPartners:
+    """
+    Считает матрицу блоками по tile_size строк и оставляет от каждой строки только k лучших
+    и k худших партнёров и сумму баллов: память O(n·k + tile_size·n) вместо O(n²).
+    """
+    n = len(arrays)
+    return TopPartners.concat([
+        top_partner_rows(arrays, start, min(start + tile_size, n), k) for start in range(0, n, tile_size)
+    ] or [top_partner_rows(arrays, 0, 0, k)])
+
+
+if __name__ == "__main__":
+    import asyncio
+    import random
+    import sys
+    import time
+
+    from scoring import calculate_compatibility
+
+    def random_profile():
+        elements = [random.random() for _ in range(4)]
+        strategies = [random.random() for _ in range(3)]
+        return Profile(
+            tuple(value / sum(elements) * 100 for value in elements),
+            tuple(value / sum(strategies) * 100 for value in strategies),
+            tuple(random.randrange(len(SIGNS)) for _ in range(6))
+        )
+
+    async def reference_matrix(profiles):
+        n = len(profiles)
+        matrix = [[0] * n for _ in range(n)]
+        for i in range(n):
+            for j in range(i + 1, n):
+                compatibility = await calculate_compatibility(profiles[i], profiles[j])
+                matrix[i][j] = matrix[j][i] = compatibility.total_score
+        return matrix
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    profiles = [random_profile() for _ in range(n)]
+
+    started = time.perf_counter()
+    expected = asyncio.run(reference_matrix(profiles))
+    reference_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = build_matrix(pack_profiles(profiles))
+    vectorized_time = time.perf_counter() - started
+
+    print(f"n={n}: совпадает={actual.tolist() == expected}, "
+          f"поэлементно {reference_time:.3f} с, векторно {vectorized_time:.3f} с, "
+          f"ускорение x{reference_time / vectorized_time:.0f}")
@@ -0,0 +1,151 @@
+from typing import Any, Dict, List, Optional, Tuple
+import uuid
+import numpy as np
+
+from compat_matrix import ProfileArrays, pack_profiles, score_between
+from matrix_pool import score_department
+from metrics import scoring_seconds
+from profile_cache import TTLCache
+from profiles import Profile
+from scoring import score_matrix
+from settings import DEPARTMENT_STORE_SIZE, DEPARTMENT_TTL
+
+
+class Department:
+    """
+    Отдел с сохранённой матрицей совместимости.
+
+    Добавление и удаление сотрудника пересчитывает одну строку матрицы, суммы по строкам
+    и total_sum_score за O(n). При удалении на место ушедшего переносится последний сотрудник,
+    поэтому сотрудники адресуются по member_id, а не по позиции.
+    """
+
+    def __init__(self, people: List[Any], profiles: List[Profile], scored: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        """
+        :param scored: Уже посчитанные матрица n×n и суммы по строкам (score_department); без них матрица
+            считается здесь через score_matrix.
+        """
+        self.department_id = uuid.uuid4().hex
+        n = len(people)
+        capacity = max(n, 8)
+        self.people = list(people)
+        self.member_ids = [uuid.uuid4().hex for _ in range(n)]
+        self.arrays = ProfileArrays(
+            np.empty((capacity, 4), dtype=np.float64),
+            np.empty((capacity, 3), dtype=np.float64),
+            np.empty((capacity, 6), dtype=np.int32)
+        )
+        packed = pack_profiles(profiles)
+        self.arrays.elements[:n] = packed.elements
+        self.arrays.strategies[:n] = packed.strategies
+        self.arrays.signs[:n] = packed.signs
+        if scored is None:
+            matrix = score_matrix(profiles)
+            scored = matrix, matrix.sum(axis=1, dtype=np.int64)
+        self.matrix = np.zeros((capacity, capacity), dtype=np.int32)
+        self.matrix[:n, :n] = scored[0]
+        self.row_totals = np.zeros(capacity, dtype=np.int64)
+        self.row_totals[:n] = scored[1]
+        self.total_sum_score = int(self.row_totals[:n].sum()) // 2
+
+    def __len__(self):
+        return len(self.people)
+
+    def _grow(self):
+        capacity = len(self.row_totals) * 2
+        n = len(self)
+        matrix = np.zeros((capacity, capacity), dtype=np.int32)
+        matrix[:n, :n] = self.matrix[:n, :n]
+        self.matrix = matrix
+        self.row_totals = np.concatenate([self.row_totals, np.zeros(capacity - len(self.row_totals), dtype=np.int64)])
+        self.arrays = ProfileArrays(
+            np.concatenate([self.arrays.elements, np.empty_like(self.arrays.elements)]),
+            np.concatenate([self.arrays.strategies, np.empty_like(self.arrays.strategies)]),
+            np.concatenate([self.arrays.signs, np.empty_like(self.arrays.signs)])
+        )
+
+    def add_member(self, person: Any, profile: Profile) -> str:
+        """
+        Добавляет сотрудника и досчитывает его строку матрицы.
+
+        :return: member_id нового сотрудника.
+        """
+        n = len(self)
+        if n == len(self.row_totals):
+            self._grow()
+        packed = pack_profiles([profile])
+        with scoring_seconds.time("row"):
+            row = score_between(packed, self.arrays.take(slice(0, n)))[0]
+        self.arrays.elements[n] = packed.elements[0]
+        self.arrays.strategies[n] = packed.strategies[0]
+        self.arrays.signs[n] = packed.signs[0]
+        self.matrix[n, :n] = row
+        self.matrix[:n, n] = row
+        self.matrix[n, n] = 0
+        row_sum = int(row.sum())
+        self.row_totals[:n] += row
+        self.row_totals[n] = row_sum
+        self.total_sum_score += row_sum
+        member_id = uuid.uuid4().hex
+        self.people.append(person)
+        self.member_ids.append(member_id)
+        return member_id
+
+    def remove_member(self, member_id: str):
+        """
+        Удаляет сотрудника: вычитает его строку из сумм и переносит на его место последнего сотрудника.
+        """
+        if member_id not in self.member_ids:
+            raise KeyError(member_id)
+        index = self.member_ids.index(member_id)
+        last = len(self) - 1
+        row = self.matrix[index, :last + 1]
+        self.row_totals[:last + 1] -= row
+        self.total_sum_score -= int(row.sum())
+        if index != last:
+            self.matrix[index, :last + 1] = self.matrix[last, :last + 1]
+            self.matrix[:last + 1, index] = self.matrix[:last + 1, last]
+            self.matrix[index, index] = 0
+            self.row_totals[index] = self.row_totals[last]
+            self.arrays.elements[index] = self.arrays.elements[last]
+            self.arrays.strategies[index] = self.arrays.strategies[last]
+            self.arrays.signs[index] = self.arrays.signs[last]
+            self.people[index] = self.people[last]
+            self.member_ids[index] = self.member_ids[last]
+        self.matrix[last, :last + 1] = 0
+        self.matrix[:last + 1, last] = 0
+        self.row_totals[last] = 0
+        self.people.pop()
+        self.member_ids.pop()
+
+    def totals(self) -> List[int]:
+        return self.row_totals[:len(self)].tolist()
+
+    def compatibility_matrix(self) -> List[List[int]]:
+        n = len(self)
+        return self.matrix[:n, :n].tolist()
+
+    def members(self) -> List[Dict[str, str]]:
+        return [
+            {"member_id": member_id, "full_name": person.full_name}
+            for member_id, person in zip(self.member_ids, self.people)
+        ]
+
+
+departments = TTLCache(DEPARTMENT_STORE_SIZE, DEPARTMENT_TTL)
+
+
+async def create_department(people: List[Any], profiles: List[Profile]) -> Department:
+    """
+    Создаёт и сохраняет отдел; матрица больших отделов считается в пуле процессов.
+    """
+    department = Department(people, profiles, await score_department(profiles))
+    departments.set(department.department_id, department)
+    return department
+
+
+def get_department(department_id: str) -> Department:
+    department = departments.get(department_id)
+    if department is None:
+        raise KeyError(department_id)
+    return department
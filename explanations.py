@@ -0,0 +1,177 @@
+"""
+Коды пояснений к совместимости и их отрисовка в текст.
+
+Анализаторы возвращают пояснения как кортежи (код, *параметры), например
+(ELEMENT_BALANCED, "fire"). Текст на нужном языке собирается только при ответе.
+"""
+from typing import Dict, List, Optional, Tuple
+
+ELEMENT_BOTH_DOMINANT = "ELEMENT_BOTH_DOMINANT"
+ELEMENT_BALANCED = "ELEMENT_BALANCED"
+ELEMENT_UNBALANCED = "ELEMENT_UNBALANCED"
+ELEMENTS_NONE_DOMINANT = "ELEMENTS_NONE_DOMINANT"
+ELEMENTS_MANY_DOMINANT = "ELEMENTS_MANY_DOMINANT"
+STRATEGY_BOTH_DOMINANT = "STRATEGY_BOTH_DOMINANT"
+STRATEGY_BALANCED = "STRATEGY_BALANCED"
+STRATEGY_DIFFERENT = "STRATEGY_DIFFERENT"
+STRATEGIES_SINGLE_DOMINANT = "STRATEGIES_SINGLE_DOMINANT"
+STRATEGIES_MANY_DOMINANT = "STRATEGIES_MANY_DOMINANT"
+SUN_MOON_HARMONY = "SUN_MOON_HARMONY"
+SUN_MOON_DISHARMONY = "SUN_MOON_DISHARMONY"
+VENUS_MARS_HARMONY = "VENUS_MARS_HARMONY"
+VENUS_MARS_DISHARMONY = "VENUS_MARS_DISHARMONY"
+SUN_SAME_ELEMENT = "SUN_SAME_ELEMENT"
+SUN_DIFFERENT_ELEMENT = "SUN_DIFFERENT_ELEMENT"
+
+SECTION_ELEMENTS = "elements"
+SECTION_STRATEGIES = "strategies"
+SECTION_ASTROLOGY = "astrology"
+
+DEFAULT_LANGUAGE = "ru"
+
+SECTION_TITLES = {
+    "ru": {
+        SECTION_ELEMENTS: "Стихии",
+        SECTION_STRATEGIES: "Стратегии поведения",
+        SECTION_ASTROLOGY: "Астрология",
+    },
+    "en": {
+        SECTION_ELEMENTS: "Elements",
+        SECTION_STRATEGIES: "Behaviour strategies",
+        SECTION_ASTROLOGY: "Astrology",
+    },
+}
+
+NAMES = {
+    "ru": {
+        "fire": "Огонь",
+        "earth": "Земля",
+        "air": "Воздух",
+        "water": "Вода",
+        "cardinal": "Кардинальность",
+        "constant": "Фиксированность",
+        "mutable": "Мутабельность",
+    },
+    "en": {
+        "fire": "Fire",
+        "earth": "Earth",
+        "air": "Air",
+        "water": "Water",
+        "cardinal": "Cardinal",
+        "constant": "Fixed",
+        "mutable": "Mutable",
+    },
+}
+
+LEVELS = {
+    "ru": {
+        "high": "Высокая совместимость",
+        "medium": "Средняя совместимость",
+        "low": "Низкая совместимость",
+    },
+    "en": {
+        "high": "High compatibility",
+        "medium": "Medium compatibility",
+        "low": "Low compatibility",
+    },
+}
+
+TEMPLATES = {
+    "ru": {
+        ELEMENT_BOTH_DOMINANT: "- Обе стороны имеют доминирующую стихию {0}, это может привести к однотипному подходу и конфликтам.",
+        ELEMENT_BALANCED: "+ Стихия {0} сбалансирована между людьми, что способствует гармонии.",
+        ELEMENT_UNBALANCED: "- Стихия {0} несбалансирована: {1:.1f}% у одного, {2:.1f}% у другого.",
+        ELEMENTS_NONE_DOMINANT: "+ У обоих нет доминирующей стихии, что способствует гибкости и адаптивности.",
+        ELEMENTS_MANY_DOMINANT: "- У одного из участников доминирует несколько стихий, что может усложнить взаимодействие.",
+        STRATEGY_BOTH_DOMINANT: "- Оба имеют доминирующую стратегию {0}, что может привести к столкновению интересов.",
+        STRATEGY_BALANCED: "+ Стратегия {0} уравновешена между участниками, это улучшает совместимость.",
+        STRATEGY_DIFFERENT: "- Различия в стратегии {0} могут вызывать недопонимание (у одного {1:.1f}%, у другого {2:.1f}%).",
+        STRATEGIES_SINGLE_DOMINANT: "+ У обоих участников доминирует только одна стратегия, что способствует сосредоточенности.",
+        STRATEGIES_MANY_DOMINANT: "- У одного из участников слишком много доминирующих стратегий, что может усложнить взаимодействие.",
+        SUN_MOON_HARMONY: "+ Солнце и Луна гармонируют, это улучшает эмоциональную совместимость.",
+        SUN_MOON_DISHARMONY: "- Солнце и Луна не гармонируют, возможны эмоциональные разногласия.",
+        VENUS_MARS_HARMONY: "+ Венера и Марс гармонируют, это улучшает социальные и профессиональные отношения.",
+        VENUS_MARS_DISHARMONY: "- Венера и Марс не гармонируют, возможны трудности в личных и рабочих взаимодействиях.",
+        SUN_SAME_ELEMENT: "+ Солнце в знаках одной стихии, это улучшает понимание и общие цели.",
+        SUN_DIFFERENT_ELEMENT: "- Солнце в разных стихиях, возможны разногласия в подходе к задачам.",
+    },
+    "en": {
+        ELEMENT_BOTH_DOMINANT: "- Both sides are dominated by {0}, which may lead to a uniform approach and conflicts.",
+        ELEMENT_BALANCED: "+ {0} is balanced between the two, which supports harmony.",
+        ELEMENT_UNBALANCED: "- {0} is unbalanced: {1:.1f}% for one, {2:.1f}% for the other.",
+        ELEMENTS_NONE_DOMINANT: "+ Neither has a dominant element, which supports flexibility and adaptability.",
+        ELEMENTS_MANY_DOMINANT: "- One of the participants has several dominant elements, which may complicate interaction.",
+        STRATEGY_BOTH_DOMINANT: "- Both are dominated by the {0} strategy, which may lead to a clash of interests.",
+        STRATEGY_BALANCED: "+ The {0} strategy is balanced between the participants, which improves compatibility.",
+        STRATEGY_DIFFERENT: "- Differences in the {0} strategy may cause misunderstanding ({1:.1f}% for one, {2:.1f}% for the other).",
+        STRATEGIES_SINGLE_DOMINANT: "+ Each participant has exactly one dominant strategy, which supports focus.",
+        STRATEGIES_MANY_DOMINANT: "- One of the participants has too many dominant strategies, which may complicate interaction.",
+        SUN_MOON_HARMONY: "+ Sun and Moon are in harmony, which improves emotional compatibility.",
+        SUN_MOON_DISHARMONY: "- Sun and Moon are not in harmony, emotional disagreements are possible.",
+        VENUS_MARS_HARMONY: "+ Venus and Mars are in harmony, which improves social and professional relations.",
+        VENUS_MARS_DISHARMONY: "- Venus and Mars are not in harmony, personal and work interactions may be difficult.",
+        SUN_SAME_ELEMENT: "+ The Suns are in signs of the same element, which improves understanding and shared goals.",
+        SUN_DIFFERENT_ELEMENT: "- The Suns are in different elements, approaches to tasks may differ.",
+    },
+}
+
+Explanation = Tuple
+
+# Коды, у которых два последних параметра — значения первого и второго участника.
+PAIRED_VALUE_CODES = {ELEMENT_UNBALANCED, STRATEGY_DIFFERENT}
+
+
+def pick_language(accept_language: Optional[str]) -> str:
+    """
+    Выбирает поддерживаемый язык с наибольшим весом q из заголовка Accept-Language;
+    при равных весах — указанный раньше. Языки с q=0 не выбираются.
+    """
+    if not accept_language:
+        return DEFAULT_LANGUAGE
+    weighted = []
+    for part in accept_language.split(","):
+        language, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weighted.append((quality, language.strip().split("-")[0].lower()))
+    for quality, language in sorted(weighted, key=lambda item: -item[0]):
+        if quality > 0 and language in TEMPLATES:
+            return language
+    return DEFAULT_LANGUAGE
+
+
+def render_explanation(explanation: Explanation, language: str = DEFAULT_LANGUAGE) -> str:
+    code, *params = explanation
+    names = NAMES[language]
+    params = [names.get(param, param) if isinstance(param, str) else param for param in params]
+    return TEMPLATES[language][code].format(*params)
+
+
+def render_explanations(explanations: Dict[str, List[Explanation]], language: str = DEFAULT_LANGUAGE) -> Dict[str, List[str]]:
+    """
+    Превращает коды пояснений по разделам в текст на выбранном языке.
+    """
+    titles = SECTION_TITLES[language]
+    return {
+        titles[section]: [render_explanation(explanation, language) for explanation in section_explanations]
+        for section, section_explanations in explanations.items()
+    }
+
+
+def mirror_explanations(explanations: Dict[str, List[Explanation]]) -> Dict[str, List[Explanation]]:
+    """
+    Переставляет значения участников в пояснениях, как если бы пара была передана в обратном порядке.
+    """
+    return {
+        section: [
+            (*explanation[:-2], explanation[-1], explanation[-2]) if explanation[0] in PAIRED_VALUE_CODES else explanation
+            for explanation in section_explanations
+        ]
+        for section, section_explanations in explanations.items()
+    }
@@ -0,0 +1,287 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
+import json
+import time
+import httpx
+import numpy as np
+
+from metrics import llm_token_seconds, llm_completion_seconds
+from resilience import CircuitBreaker, UnavailableError
+from settings import (
+    RQUID, AUTHKEY, GIGACHAT_OAUTH_URL, GIGACHAT_URL, GIGACHAT_CA_BUNDLE,
+    GIGACHAT_TOKEN_REFRESH_AHEAD, GIGACHAT_TOKEN_MARGIN, GIGACHAT_MAX_CONNECTIONS, GIGACHAT_SKILLS_BATCH_SIZE,
+    GIGACHAT_SKILLS_CONCURRENCY, GIGACHAT_SKILLS_BUDGET, GIGACHAT_TIMEOUT, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+)
+
+SKILLS_PROMPT = 'Оценить совместимость двух наборов навыков для совместной работы по шкале от 0 до 10. Указать только балл совместимости.'
+SKILLS_BATCH_PROMPT = (
+    'Оценить совместимость наборов навыков в каждой пронумерованной паре для совместной работы по шкале от 0 до 10. '
+    'Ответить только JSON-массивом целых баллов в порядке пар, без пояснений.'
+)
+
+gigachat_client: Optional[httpx.AsyncClient] = None
+# Пока выключатель разомкнут, эндпоинты не обращаются к GigaChat и отвечают без его оценок.
+gigachat_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
+
+def get_gigachat_client() -> httpx.AsyncClient:
+    """
+    Общий клиент GigaChat; создаётся при первом обращении, чтобы без GigaChat не требовался chain.pem.
+    """
+    global gigachat_client
+    if gigachat_client is None:
+        gigachat_client = httpx.AsyncClient(
+            verify=GIGACHAT_CA_BUNDLE,
+            timeout=GIGACHAT_TIMEOUT,
+            limits=httpx.Limits(max_connections=GIGACHAT_MAX_CONNECTIONS)
+        )
+    return gigachat_client
+
+
+async def close_gigachat_client():
+    global gigachat_client
+    if gigachat_client is not None:
+        await gigachat_client.aclose()
+        gigachat_client = None
+
+
+class TokenError(Exception):
+    """
+    OAuth GigaChat отклонил запрос токена или вернул ответ без токена.
+    """
+
+
+class TokenManager:
+    """
+    Хранит токен GigaChat до его истечения.
+
+    Незадолго до истечения токен обновляется в фоне, а одновременные запросы на обновление
+    объединяются в один вызов OAuth.
+    """
+
+    def __init__(self, refresh_ahead: float = GIGACHAT_TOKEN_REFRESH_AHEAD, margin: float = GIGACHAT_TOKEN_MARGIN):
+        self.refresh_ahead = refresh_ahead
+        self.margin = margin
+        self.access_token: Optional[str] = None
+        self.expires_at = 0.0
+        self.refreshes = 0
+        self._refresh: Optional[asyncio.Future] = None
+
+    async def get_token(self) -> str:
+        remaining = self.expires_at - time.time()
+        if self.access_token is not None and remaining > self.margin:
+            if remaining < self.refresh_ahead:
+                self._start_refresh()
+            return self.access_token
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self) -> asyncio.Future:
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._fetch_token())
+            self._refresh.add_done_callback(self._refresh_done)
+        return self._refresh
+
+    def _refresh_done(self, future: asyncio.Future):
+        self._refresh = None
+        if not future.cancelled():
+            # Ошибку фонового обновления получит следующий ожидающий вызов get_token.
+            future.exception()
+
+    async def _fetch_token(self) -> str:
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json',
+            'RqUID': RQUID,
+            'Authorization': f'Basic {AUTHKEY}'
+        }
+        response = await get_gigachat_client().post(GIGACHAT_OAUTH_URL, headers=headers, data={'scope': 'GIGACHAT_API_PERS'})
+        if response.status_code >= 500:
+            raise UnavailableError(f"GigaChat OAuth request failed with status code {response.status_code}")
+        if response.status_code != 200:
+            raise TokenError(f"GigaChat OAuth request failed with status code {response.status_code}")
+        try:
+            token_object = response.json()
+            access_token = token_object['access_token']
+            # expires_at приходит в миллисекундах.
+            expires_at = token_object['expires_at'] / 1000
+        except (ValueError, KeyError, TypeError) as e:
+            raise TokenError(f"Invalid GigaChat OAuth response: {e!r}") from e
+        self.refreshes += 1
+        self.access_token = access_token
+        self.expires_at = expires_at
+        return self.access_token
+
+
+token_manager = TokenManager()
+
+
+async def chat_completion(messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> httpx.Response:
+    """
+    Отправляет запрос к GigaChat через общий клиент с кэшированным токеном и через gigachat_breaker.
+
+    :raises UnavailableError: GigaChat или его OAuth не ответил за GIGACHAT_TIMEOUT, вернул 5xx
+        или выключатель разомкнут.
+    :raises TokenError: OAuth отклонил запрос токена.
+    """
+    payload = {
+        "model": "GigaChat",
+        "messages": messages,
+        "temperature": temperature,
+        "top_p": 0.1,
+        "n": 1,
+        "stream": False,
+        "max_tokens": max_tokens,
+        "repetition_penalty": 1
+    }
+
+    async def call() -> httpx.Response:
+        try:
+            with llm_token_seconds.time():
+                access_token = await token_manager.get_token()
+            headers = {
+                'Content-Type': 'application/json',
+                'Accept': 'application/json',
+                'Authorization': f'Bearer {access_token}'
+            }
+            with llm_completion_seconds.time():
+                response = await get_gigachat_client().post(GIGACHAT_URL, headers=headers, content=json.dumps(payload))
+        except httpx.TransportError as e:
+            raise UnavailableError(f"GigaChat request failed: {e!r}") from e
+        if response.status_code >= 500:
+            raise UnavailableError(f"GigaChat request failed with status code {response.status_code}")
+        return response
+
+    return await gigachat_breaker.call(call)
+
+
+def message_content(response: httpx.Response) -> Optional[str]:
+    if response.status_code != 200:
+        return None
+    try:
+        return response.json()['choices'][0]['message']['content']
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def skills_text(skills1: Sequence[str], skills2: Sequence[str]) -> str:
+    return f"User1: {', '.join(skills1)}; User2: {', '.join(skills2)};"
+
+
+async def score_skills(skills1: Sequence[str], skills2: Sequence[str]) -> int:
+    """
+    Оценивает совместимость навыков одной пары отдельным запросом.
+
+    :return: Балл от 0 до 10; 0, если GigaChat недоступен, токен не получен или ответ не удалось разобрать.
+    """
+    try:
+        response = await chat_completion([
+            {'role': 'system', 'content': SKILLS_PROMPT},
+            {'role': 'user', 'content': skills_text(skills1, skills2)}
+        ], temperature=0.3, max_tokens=50)
+    except (UnavailableError, TokenError):
+        return 0
+    message = message_content(response)
+    try:
+        score = int(message.strip())
+    except (AttributeError, ValueError):
+        return 0
+    return score if 0 <= score <= 10 else 0
+
+
+def parse_batch_scores(message: Optional[str], count: int) -> Optional[List[int]]:
+    """
+    Достаёт из ответа JSON-массив из count баллов от 0 до 10; None, если ответ не подходит.
+    """
+    if message is None:
+        return None
+    start = message.find('[')
+    stop = message.rfind(']')
+    if start == -1 or stop < start:
+        return None
+    try:
+        scores = json.loads(message[start:stop + 1])
+    except ValueError:
+        return None
+    if not isinstance(scores, list) or len(scores) != count:
+        return None
+    if not all(isinstance(score, int) and not isinstance(score, bool) and 0 <= score <= 10 for score in scores):
+        return None
+    return scores
+
+
+async def _score_skills_chunk(pairs: Sequence[Tuple[Sequence[str], Sequence[str]]], semaphore: asyncio.Semaphore) -> List[int]:
+    async def limited(call, *args, **kwargs):
+        async with semaphore:
+            return await call(*args, **kwargs)
+
+    lines = [f"{number}. {skills_text(skills1, skills2)}" for number, (skills1, skills2) in enumerate(pairs, 1)]
+    try:
+        response = await limited(chat_completion, [
+            {'role': 'system', 'content': SKILLS_BATCH_PROMPT},
+            {'role': 'user', 'content': "\n".join(lines)}
+        ], temperature=0.3, max_tokens=8 * len(pairs) + 20)
+    except (UnavailableError, TokenError):
+        # Оценки пропускаются: по одной паре GigaChat тоже не ответит.
+        return [0] * len(pairs)
+    scores = parse_batch_scores(message_content(response), len(pairs))
+    if scores is None:
+        scores = await asyncio.gather(*(limited(score_skills, skills1, skills2) for skills1, skills2 in pairs))
+    return list(scores)
+
+
+async def score_skills_batch(pairs: Sequence[Tuple[Sequence[str], Sequence[str]]],
+                             batch_size: int = GIGACHAT_SKILLS_BATCH_SIZE,
+                             concurrency: int = GIGACHAT_SKILLS_CONCURRENCY,
+                             budget: Optional[float] = None) -> List[int]:
+    """
+    Оценивает совместимость навыков многих пар: по batch_size пар в одном запросе, не больше concurrency
+    запросов одновременно. Если ответ на пакет не разбирается, пары этого пакета оцениваются по одной.
+
+    :param budget: Сколько секунд ждать оценок; пары пакетов, не оценённых за это время, получают 0.
+    :return: Баллы от 0 до 10 в порядке pairs.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    chunks = [pairs[start:start + batch_size] for start in range(0, len(pairs), batch_size)]
+    tasks = [asyncio.ensure_future(_score_skills_chunk(chunk, semaphore)) for chunk in chunks]
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=budget)
+        for task in pending:
+            task.cancel()
+    scores = []
+    for chunk, task in zip(chunks, tasks):
+        if task.done() and not task.cancelled() and task.exception() is None:
+            scores.extend(task.result())
+        else:
+            scores.extend([0] * len(chunk))
+    return scores
+
+
+async def skills_matrix(skill_lists: Sequence[Sequence[str]], budget: float = GIGACHAT_SKILLS_BUDGET) -> np.ndarray:
+    """
+    Считает матрицу совместимости навыков отдела. Одинаковые наборы навыков оцениваются один раз;
+    пары, не оценённые за budget секунд, получают 0.
+
+    :return: Симметричная матрица n×n типа int32 с нулевой диагональю.
+    """
+    index = {}
+    unique = []
+    classes = np.empty(len(skill_lists), dtype=np.intp)
+    for i, skills in enumerate(skill_lists):
+        key = tuple(sorted(skills))
+        class_index = index.get(key)
+        if class_index is None:
+            class_index = index[key] = len(unique)
+            unique.append(key)
+        classes[i] = class_index
+
+    m = len(unique)
+    counts = np.bincount(classes, minlength=m)
+    # Класс с самим собой оценивается, только если в нём больше одного сотрудника.
+    pairs = [(i, j) for i in range(m) for j in range(i, m) if i != j or counts[i] > 1]
+    scores = await score_skills_batch([(unique[i], unique[j]) for i, j in pairs], budget=budget)
+    class_matrix = np.zeros((m, m), dtype=np.int32)
+    for (i, j), score in zip(pairs, scores):
+        class_matrix[i, j] = class_matrix[j, i] = score
+    matrix = class_matrix[np.ix_(classes, classes)]
+    np.fill_diagonal(matrix, 0)
+    return matrix
@@ -0,0 +1,123 @@
+"""
+Нагрузочный тест одного процесса uvicorn против заглушек lifexpert.ru и GigaChat из stubs.py.
+
+Для каждого эндпоинта, размера отдела и уровня параллелизма concurrency клиентов в замкнутом цикле
+отправляют запросы в течение --duration секунд (следующий запрос — сразу после ответа на предыдущий).
+Печатает пропускную способность и p50/p95/p99 задержки:
+
+    python loadtest.py --concurrency 1,8,32,128 --sizes 10,100 --latency 0.05 --error-rate 0.01
+"""
+from collections import Counter
+from typing import Callable, Dict, List
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from benchmark import people, pair_body, parse_sizes, git_revision
+from stubs import start_stubs, start_app, stop_process
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": max(latencies)}
+
+
+async def closed_loop(client: httpx.AsyncClient, path: str, make_body: Callable[[], Dict],
+                      concurrency: int, duration: float) -> Dict:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    latencies = []
+    statuses = Counter()
+
+    async def worker():
+        while loop.time() < deadline:
+            body = make_body()
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "latency": latency_summary(latencies),
+        "status": dict(statuses)
+    }
+
+
+async def sweep(app_url: str, concurrencies: List[int], sizes: List[int], duration: float,
+                date_pool: int, seed: int) -> List[Dict]:
+    rng = random.Random(seed)
+    dates = [f"{1950 + i // 365 % 60}-{1 + i // 28 % 12:02d}-{1 + i % 28:02d}" for i in range(date_pool)]
+
+    def random_people(n: int) -> List[Dict]:
+        return people([rng.choice(dates) for _ in range(n)])
+
+    cases = [("two-people", "/api/cosmostat/two-people", 2, lambda: pair_body(random_people(2)))]
+    for n in sizes:
+        cases.append(("department", "/api/cosmostat/department", n, lambda n=n: {"people": random_people(n)}))
+
+    results = []
+    limits = httpx.Limits(max_connections=max(concurrencies), max_keepalive_connections=max(concurrencies))
+    async with httpx.AsyncClient(base_url=app_url, timeout=120, limits=limits) as client:
+        for name, path, n, make_body in cases:
+            for concurrency in concurrencies:
+                measured = await closed_loop(client, path, make_body, concurrency, duration)
+                results.append({"name": name, "n": n, "concurrency": concurrency, **measured})
+                latency = measured["latency"]
+                print(
+                    f"{name:<11} n={n:<5} c={concurrency:<4} {measured['throughput']:8.1f} req/s  "
+                    f"p50 {latency.get('p50', 0) * 1000:8.1f} мс  p95 {latency.get('p95', 0) * 1000:8.1f} мс  "
+                    f"p99 {latency.get('p99', 0) * 1000:8.1f} мс  {dict(measured['status'])}",
+                    file=sys.stderr
+                )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API против заглушек")
+    parser.add_argument("--app", default="api_main_v3", help="модуль API")
+    parser.add_argument("--concurrency", type=parse_sizes, default=[1, 8, 32, 128])
+    parser.add_argument("--sizes", type=parse_sizes, default=[10, 100], help="размеры отдела")
+    parser.add_argument("--duration", type=float, default=10, help="длительность каждого уровня, с")
+    parser.add_argument("--date-pool", type=int, default=20000, help="из скольких дат рождения выбираются сотрудники")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка заглушки lifexpert.ru, с")
+    parser.add_argument("--gigachat-latency", type=float, default=0.3, help="задержка заглушки GigaChat, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503 от заглушек")
+    parser.add_argument("--gigachat", action="store_true", help="включить GigaChat (ISONGPT=True) для v4")
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    stubs, stub_url = start_stubs(args.latency, args.gigachat_latency, args.error_rate)
+    try:
+        app, app_url = start_app(args.app, stub_url, {"ISONGPT": "True" if args.gigachat else "False"})
+        try:
+            results = asyncio.run(sweep(app_url, args.concurrency, args.sizes, args.duration, args.date_pool, args.seed))
+        finally:
+            stop_process(app)
+        upstream_calls = httpx.get(f"{stub_url}/stats").json()
+    finally:
+        stop_process(stubs)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {"revision": git_revision(), "args": vars(args), "upstream_calls": upstream_calls},
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,152 @@
+"""
+Расчёт матрицы совместимости больших отделов в пуле процессов.
+
+Пока NumPy считает матрицу на 1000+ человек, событийный цикл занят и остальные запросы ждут.
+Поэтому матрица больших отделов делится на блоки строк, блоки считаются в процессах пула
+параллельно, а цикл в это время обслуживает другие запросы.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+import asyncio
+import multiprocessing
+import numpy as np
+
+from compat_matrix import ProfileArrays, TopPartners, pack_profiles, score_rows, iter_rows, top_partner_rows, top_partners
+from metrics import scoring_seconds
+from profiles import Profile
+from scoring import group_profiles, score_matrix
+from settings import MATRIX_POOL_MIN_SIZE, MATRIX_POOL_WORKERS, MATRIX_TILE_SIZE
+
+matrix_pool: Optional[ProcessPoolExecutor] = None
+
+
+def open_matrix_pool() -> ProcessPoolExecutor:
+    global matrix_pool
+    if matrix_pool is None:
+        # spawn, а не fork: форк процесса с работающим событийным циклом и потоками небезопасен.
+        matrix_pool = ProcessPoolExecutor(MATRIX_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return matrix_pool
+
+
+def close_matrix_pool():
+    global matrix_pool
+    if matrix_pool is not None:
+        matrix_pool.shutdown(cancel_futures=True)
+        matrix_pool = None
+
+
+def score_block(arrays: ProfileArrays, start: int, stop: int, zero_diagonal: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Выполняется в процессе пула: строки start..stop матрицы и их суммы.
+    """
+    block = score_rows(arrays, start, stop, zero_diagonal)
+    return block, block.sum(axis=1, dtype=np.int64)
+
+
+async def map_row_blocks(func: Callable, arrays: ProfileArrays, *args) -> List[Tuple[int, object]]:
+    """
+    Делит строки матрицы на блоки и вызывает func(arrays, start, stop, *args) для каждого блока в пуле.
+
+    :return: Пары (начало блока, результат func) по порядку блоков.
+    """
+    n = len(arrays)
+    # Блоков не меньше, чем процессов, чтобы загрузить все ядра.
+    tile_size = max(1, min(MATRIX_TILE_SIZE, -(-n // MATRIX_POOL_WORKERS)))
+    starts = range(0, n, tile_size)
+    loop = asyncio.get_running_loop()
+    pool = open_matrix_pool()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, func, arrays, start, min(start + tile_size, n), *args)
+        for start in starts
+    ))
+    return list(zip(starts, results))
+
+
+async def build_matrix_in_pool(arrays: ProfileArrays, zero_diagonal: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Считает матрицу блоками строк в пуле процессов и собирает матрицу и суммы по строкам.
+    """
+    n = len(arrays)
+    matrix = np.empty((n, n), dtype=np.int32)
+    row_totals = np.empty(n, dtype=np.int64)
+    for start, (block, block_totals) in await map_row_blocks(score_block, arrays, zero_diagonal):
+        matrix[start:start + len(block)] = block
+        row_totals[start:start + len(block)] = block_totals
+    return matrix, row_totals
+
+
+async def score_department(profiles: List[Profile]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Считает матрицу совместимости отдела и суммы по строкам.
+
+    Если разных профилей меньше MATRIX_POOL_MIN_SIZE или пул отключён, матрица считается
+    в основном процессе через score_matrix.
+
+    :return: Симметричная матрица n×n типа int32 с нулевой диагональю и суммы по строкам типа int64.
+    """
+    unique, classes = group_profiles(profiles)
+    if MATRIX_POOL_WORKERS <= 0 or len(unique) < MATRIX_POOL_MIN_SIZE:
+        matrix = score_matrix(profiles, (unique, classes))
+        return matrix, matrix.sum(axis=1, dtype=np.int64)
+    with scoring_seconds.time("matrix_pool"):
+        if len(unique) == len(profiles):
+            return await build_matrix_in_pool(pack_profiles(profiles), zero_diagonal=True)
+        class_matrix, _ = await build_matrix_in_pool(pack_profiles(unique), zero_diagonal=False)
+        # Сумма строки сотрудника — баллы его класса со всеми сотрудниками минус балл с самим собой.
+        counts = np.bincount(classes, minlength=len(unique))
+        class_totals = class_matrix.astype(np.int64) @ counts - np.diagonal(class_matrix)
+        matrix = class_matrix[np.ix_(classes, classes)]
+        np.fill_diagonal(matrix, 0)
+        return matrix, class_totals[classes]
+
+
+async def stream_rows(arrays: ProfileArrays, tile_size: int = MATRIX_TILE_SIZE) -> AsyncIterator[Tuple[int, np.ndarray]]:
+    """
+    Асинхронный вариант iter_rows: отдаёт строки матрицы по одной.
+
+    Отделы от MATRIX_POOL_MIN_SIZE человек считаются блоками по tile_size строк в пуле процессов,
+    не больше MATRIX_POOL_WORKERS блоков вперёд, чтобы в памяти оставалось лишь несколько блоков.
+    """
+    n = len(arrays)
+    if MATRIX_POOL_WORKERS <= 0 or n < MATRIX_POOL_MIN_SIZE:
+        for i, row in iter_rows(arrays, tile_size):
+            yield i, row
+        return
+    loop = asyncio.get_running_loop()
+    pool = open_matrix_pool()
+    starts = iter(range(0, n, tile_size))
+    pending = deque()
+
+    def submit():
+        start = next(starts, None)
+        if start is not None:
+            pending.append((start, loop.run_in_executor(pool, score_rows, arrays, start, min(start + tile_size, n))))
+
+    try:
+        for _ in range(MATRIX_POOL_WORKERS):
+            submit()
+        while pending:
+            start, future = pending.popleft()
+            block = await future
+            submit()
+            for offset in range(len(block)):
+                yield start + offset, block[offset]
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+async def department_partners(profiles: List[Profile], k: int) -> TopPartners:
+    """
+    Находит для каждого сотрудника k лучших и k худших партнёров и сумму баллов, не храня матрицу n×n.
+
+    Отделы от MATRIX_POOL_MIN_SIZE человек считаются блоками строк в пуле процессов;
+    каждый процесс возвращает только выбранных партнёров своего блока.
+    """
+    arrays = pack_profiles(profiles)
+    if MATRIX_POOL_WORKERS <= 0 or not profiles or len(profiles) < MATRIX_POOL_MIN_SIZE:
+        with scoring_seconds.time("partners"):
+            return top_partners(arrays, k)
+    with scoring_seconds.time("partners_pool"):
+        return TopPartners.concat([part for _, part in await map_row_blocks(top_partner_rows, arrays, k)])
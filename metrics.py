@@ -0,0 +1,197 @@
+"""
+Метрики по этапам обработки запроса в текстовом формате Prometheus (GET /metrics).
+
+MetricsMiddleware запоминает для каждого запроса эндпоинт (шаблон пути) и размер отдела,
+который эндпоинт сообщает через set_department_size. Все наблюдения внутри запроса
+получают метки endpoint и size_bucket; вне запросов метки пустые.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import bisect
+import time
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = ((2, "1-2"), (10, "3-10"), (100, "11-100"), (1000, "101-1000"))
+
+
+def size_bucket(size: Optional[int]) -> str:
+    if size is None:
+        return ""
+    for limit, label in SIZE_BUCKETS:
+        if size <= limit:
+            return label
+    return "1001+"
+
+
+class RequestLabels:
+    """
+    Метки текущего запроса. Если stages не None (запрос профилируется), гистограммы
+    дополнительно суммируют в нём время и число наблюдений по имени метрики.
+    """
+    __slots__ = ("scope", "size", "stages")
+
+    def __init__(self, scope: Dict):
+        self.scope = scope
+        self.size = None
+        self.stages: Optional[Dict[str, List]] = None
+
+    def values(self) -> Tuple[str, str]:
+        route = self.scope.get("route")
+        return getattr(route, "path", "other"), size_bucket(self.size)
+
+
+request_labels: ContextVar[Optional[RequestLabels]] = ContextVar("request_labels", default=None)
+
+
+def current_labels() -> Tuple[str, str]:
+    labels = request_labels.get()
+    return labels.values() if labels is not None else ("", "")
+
+
+def set_department_size(size: int):
+    labels = request_labels.get()
+    if labels is not None:
+        labels.size = size
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Гистограмма с метками endpoint и size_bucket текущего запроса и дополнительными extra_labels.
+    """
+
+    def __init__(self, name: str, documentation: str, extra_labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = ("endpoint", "size_bucket", *extra_labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[tuple, List] = {}
+
+    def observe(self, value: float, *extra_values: str):
+        labels = request_labels.get()
+        if labels is not None and labels.stages is not None:
+            stage = labels.stages.setdefault(self.name, [0.0, 0])
+            stage[0] += value
+            stage[1] += 1
+        key = (*current_labels(), *extra_values)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *extra_values: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *extra_values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                labels = format_labels((*self.label_names, "le"), (*key, format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    """
+    Счётчик с метками endpoint и size_bucket текущего запроса и дополнительными extra_labels.
+    """
+
+    def __init__(self, name: str, documentation: str, extra_labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = ("endpoint", "size_bucket", *extra_labels)
+        self.series: Dict[tuple, float] = {}
+
+    def inc(self, *extra_values: str, amount: float = 1):
+        if not amount:
+            return
+        key = (*current_labels(), *extra_values)
+        self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name}_total {self.documentation}", f"# TYPE {self.name}_total counter"]
+        for key, value in self.series.items():
+            lines.append(f"{self.name}_total{format_labels(self.label_names, key)} {format_value(value)}")
+        return lines
+
+
+request_seconds = Histogram("cosmostat_request_seconds", "Время обработки запроса.")
+upstream_seconds = Histogram("cosmostat_upstream_request_seconds", "Время запроса к lifexpert.ru с учётом хеджирования.")
+profiles_seconds = Histogram("cosmostat_profiles_seconds", "Время получения всех профилей запроса.")
+profile_seconds = Histogram("cosmostat_profile_seconds", "Время загрузки одного профиля, не найденного в кэше.")
+scoring_seconds = Histogram("cosmostat_scoring_seconds", "Время расчёта совместимости.", ("stage",))
+llm_token_seconds = Histogram("cosmostat_llm_token_seconds", "Время получения токена GigaChat для запроса.")
+llm_completion_seconds = Histogram("cosmostat_llm_completion_seconds", "Время запроса к GigaChat.")
+cache_lookups = Counter("cosmostat_cache_lookups", "Обращения к кэшам.", ("cache", "result"))
+
+METRICS = [
+    request_seconds, upstream_seconds, profiles_seconds, profile_seconds,
+    scoring_seconds, llm_token_seconds, llm_completion_seconds, cache_lookups
+]
+
+
+def render_metrics(cache_stats: Optional[Dict[str, Dict]] = None) -> str:
+    """
+    Собирает все метрики в текстовом формате Prometheus.
+
+    :param cache_stats: Статистика кэшей по имени (TTLCache.stats), выводится как gauge.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    if cache_stats:
+        for field, documentation in (("size", "Число записей в кэше."), ("hit_ratio", "Доля попаданий в кэш с запуска.")):
+            name = f"cosmostat_cache_{field}"
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            for cache, stats in cache_stats.items():
+                lines.append(f"{name}{format_labels(('cache',), (cache,))} {format_value(stats[field])}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: задаёт метки запроса и измеряет его полное время, включая потоковую отдачу.
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        labels = RequestLabels(scope)
+        token = request_labels.set(labels)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_seconds.observe(time.perf_counter() - started)
+            request_labels.reset(token)
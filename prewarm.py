@@ -0,0 +1,89 @@
+"""
+Заранее считает профили сотрудников из списка и сохраняет их в PROFILE_STORE_PATH.
+
+Список — CSV с заголовком или JSONL с полями full_name, birth_date, skills; нужна только birth_date.
+Профили считаются тем же провайдером, что и в API (PROFILE_PROVIDER), пакетами по PROFILE_BATCH_SIZE дат,
+не больше concurrency пакетов одновременно. Уже сохранённые даты пропускаются, поэтому
+прерванный запуск можно просто повторить:
+
+    python prewarm.py roster.csv [concurrency]
+"""
+from typing import List
+import asyncio
+import csv
+import json
+import sys
+import time
+
+from profiles import (
+    DEFAULT_COORD, profile_key, calculate_local_profile, fetch_remote_profiles, close_upstream_client, check_provider
+)
+from profile_store import read_store, append_store
+from settings import PROFILE_PROVIDER, PROFILE_STORE_PATH, PROFILE_BATCH_SIZE, PROFILE_FETCH_CONCURRENCY
+
+
+def read_roster(path: str) -> List[str]:
+    """
+    Читает даты рождения из CSV или JSONL, без повторов и в порядке появления.
+    """
+    with open(path, encoding="utf-8-sig") as f:
+        if path.endswith(".jsonl"):
+            people = [json.loads(line) for line in f if line.strip()]
+        else:
+            people = list(csv.DictReader(f))
+    return list(dict.fromkeys(person["birth_date"] for person in people if person.get("birth_date")))
+
+
+async def compute_profiles(date_strs: List[str]):
+    if PROFILE_PROVIDER == "local":
+        return {date_str: calculate_local_profile(date_str) for date_str in date_strs}
+    return await fetch_remote_profiles(date_strs)
+
+
+async def prewarm(roster_path: str, store_path: str, concurrency: int) -> int:
+    """
+    :return: Число дат, для которых профиль посчитать не удалось.
+    """
+    stored = {key for key, _ in read_store(store_path)}
+    dates = [date_str for date_str in read_roster(roster_path) if profile_key(date_str, DEFAULT_COORD) not in stored]
+    total = len(dates)
+    print(f"В списке {total + len(stored)} дат, уже сохранено {len(stored)}, осталось {total}", file=sys.stderr)
+    chunks = [dates[i:i + PROFILE_BATCH_SIZE] for i in range(0, total, PROFILE_BATCH_SIZE)]
+    semaphore = asyncio.Semaphore(concurrency)
+    done = failed = 0
+    started = time.perf_counter()
+
+    async def run_chunk(chunk: List[str]):
+        nonlocal done, failed
+        async with semaphore:
+            try:
+                profiles = await compute_profiles(chunk)
+            except Exception as e:
+                failed += len(chunk)
+                print(f"Ошибка для {chunk[0]}..{chunk[-1]}: {e}", file=sys.stderr)
+                return
+        append_store(store_path, {profile_key(date_str, DEFAULT_COORD): profile for date_str, profile in profiles.items()})
+        done += len(profiles)
+        print(f"{done}/{total} профилей, ошибок {failed}, {time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+    try:
+        await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+    finally:
+        await close_upstream_client()
+    return failed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python prewarm.py roster.csv|roster.jsonl [concurrency]")
+        sys.exit(2)
+    if not PROFILE_STORE_PATH:
+        print("PROFILE_STORE_PATH is not set")
+        sys.exit(2)
+    try:
+        check_provider()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(2)
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else PROFILE_FETCH_CONCURRENCY
+    sys.exit(1 if asyncio.run(prewarm(sys.argv[1], PROFILE_STORE_PATH, concurrency)) else 0)
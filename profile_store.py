@@ -0,0 +1,67 @@
+"""
+Хранилище заранее посчитанных профилей на диске.
+
+Файл в формате JSONL, по одной записи на строку: ключ profile_key и профиль.
+Записи только дописываются в конец, поэтому прерванное заполнение можно продолжить.
+"""
+from typing import Dict, Iterator, Tuple
+import json
+import os
+
+from profiles import Profile, stored_profiles
+from settings import PROFILE_STORE_PATH
+
+
+def encode_record(key: tuple, profile: Profile) -> str:
+    return json.dumps({
+        "key": list(key),
+        "elements": list(profile.elements),
+        "strategies": list(profile.strategies),
+        "signs": list(profile.signs)
+    }, ensure_ascii=False)
+
+
+def read_store(path: str) -> Iterator[Tuple[tuple, Profile]]:
+    """
+    Читает записи хранилища; оборванная последняя строка (например, после прерывания) пропускается.
+    """
+    if not path or not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                profile = Profile(tuple(record["elements"]), tuple(record["strategies"]), tuple(record["signs"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+            yield tuple(record["key"]), profile
+
+
+def append_store(path: str, profiles: Dict[tuple, Profile]):
+    """
+    Дописывает записи в конец хранилища, начиная с новой строки, если последняя строка оборвана.
+    """
+    broken_line = False
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            broken_line = f.read(1) != b"\n"
+    with open(path, "a", encoding="utf-8") as f:
+        if broken_line:
+            f.write("\n")
+        for key, profile in profiles.items():
+            f.write(encode_record(key, profile) + "\n")
+
+
+def load_profile_store(path: str = PROFILE_STORE_PATH) -> int:
+    """
+    Загружает профили из хранилища в stored_profiles; вызывается при старте приложения.
+    Эти профили, в отличие от profile_cache, не вытесняются и не устаревают.
+
+    :return: Число загруженных профилей.
+    """
+    count = 0
+    for key, profile in read_store(path):
+        stored_profiles.set(key, profile)
+        count += 1
+    return count
@@ -0,0 +1,434 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
+import hashlib
+import struct
+import time
+import httpx
+
+from astro_local import calculate_astro_frame, CALIBRATED as LOCAL_CALIBRATED
+from metrics import upstream_seconds, profiles_seconds, profile_seconds, cache_lookups
+from profile_cache import TTLCache, PermanentCache
+from resilience import CircuitBreaker, UnavailableError, hedged
+from settings import (
+    PROFILE_PROVIDER, LIFEXPERT_URL, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL,
+    UPSTREAM_MAX_CONNECTIONS, UPSTREAM_MAX_KEEPALIVE, PROFILE_FETCH_CONCURRENCY, PROFILE_BATCH_SIZE,
+    UPSTREAM_TIMEOUT, UPSTREAM_HEDGE_DELAY, UPSTREAM_HEDGE_ATTEMPTS, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+)
+
+DEFAULT_COORD = {
+    "lat": 59.9503,
+    "lng": 30.3903,
+    "country": "RU",
+    "verbose": "Центральный р-н, Санкт-Петербург"
+}
+
+profile_cache = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+# Профили из PROFILE_STORE_PATH: не вытесняются и не устаревают, проверяются после profile_cache.
+stored_profiles = PermanentCache()
+frames_cache = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+
+upstream_client: Optional[httpx.AsyncClient] = None
+upstream_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+# Загрузки профилей, которые выполняются сейчас, по profile_key.
+inflight_profiles: Dict[tuple, asyncio.Future] = {}
+
+ASTRO_FRAME = "datetime_calcs.astro_frame"
+DESTINYWILL = "datetime_calcs.destinywill"
+PIFAGOR_FRAME = "datetime_calcs.pifagor_frame"
+
+# Детализация "full": кроме astro_frame, нужного для расчёта совместимости, отдельно
+# и только по явному запросу загружаются остальные фреймы.
+DETAIL_FULL = "full"
+EXTRA_FRAME_METHODS = [DESTINYWILL, PIFAGOR_FRAME]
+
+ELEMENT_KEYS = ["Огонь", "Земля", "Воздух", "Вода"]
+STRATEGY_KEYS = ["Кардинальность", "Фиксированность", "Мутабельность"]
+ELEMENT_IDS = ["fire", "earth", "air", "water"]
+STRATEGY_IDS = ["cardinal", "constant", "mutable"]
+PLANET_KEYS = ["Солнце", "Луна", "Венера", "Марс", "Юпитер", "Сатурн"]
+PLANET_CODES = ["sun", "moon", "venus", "mars", "jupiter", "saturn"]
+SUN, MOON, VENUS, MARS, JUPITER, SATURN = range(len(PLANET_CODES))
+
+SIGNS = ["Овен", "Телец", "Близнецы", "Рак", "Лев", "Дева", "Весы", "Скорпион", "Стрелец", "Козерог", "Водолей", "Рыбы", "Неизвестно"]
+UNKNOWN_SIGN = len(SIGNS) - 1
+# Совместимость по стихии Солнца исторически определяется по первой букве названия знака.
+SIGN_LETTERS = [name[:1] for name in SIGNS]
+
+
+class Profile:
+    """
+    Профиль человека: доли стихий и стратегий в процентах в порядке ELEMENT_KEYS и STRATEGY_KEYS,
+    коды знаков планет (индексы SIGNS) в порядке PLANET_KEYS.
+    """
+    __slots__ = ("elements", "strategies", "signs", "_fingerprint")
+
+    def __init__(self, elements: Tuple[float, ...], strategies: Tuple[float, ...], signs: Tuple[int, ...]):
+        self.elements = elements
+        self.strategies = strategies
+        self.signs = signs
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self) -> bytes:
+        """
+        Хэш содержимого профиля, одинаковый для равных профилей в любом процессе.
+        """
+        if self._fingerprint is None:
+            packed = struct.pack("<4d3d6b", *self.elements, *self.strategies, *self.signs)
+            self._fingerprint = hashlib.blake2b(packed, digest_size=16).digest()
+        return self._fingerprint
+
+    def __eq__(self, other):
+        return isinstance(other, Profile) and (self.elements, self.strategies, self.signs) == (other.elements, other.strategies, other.signs)
+
+    def __hash__(self):
+        return hash((self.elements, self.strategies, self.signs))
+
+    def __repr__(self):
+        return f"Profile(elements={self.elements}, strategies={self.strategies}, signs={self.signs})"
+
+
+def build_call(method: str, date_str: str, coord: Dict, request_id: int) -> Dict:
+    if method == ASTRO_FRAME:
+        params = {
+            "date": date_str,
+            "coord": coord,
+            "options": {
+                "houses_system": "K",
+                "use_aspect_node": False,
+                "use_aspect_lilith": False
+            }
+        }
+    elif method == PIFAGOR_FRAME:
+        params = {
+            "date": date_str,
+            "death_date": None,
+            "fio": [],
+            "use_1999": False
+        }
+    else:
+        params = {
+            "date": date_str
+        }
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "method": method,
+        "params": params
+    }
+
+
+def build_payload(date_str: str, coord: Dict = DEFAULT_COORD, first_id: int = 53, methods: Sequence[str] = (ASTRO_FRAME,)) -> list:
+    return [build_call(method, date_str, coord, first_id + i) for i, method in enumerate(methods)]
+
+
+def parse_astro_frame(astro_frame: Dict) -> Profile:
+    """
+    Преобразует результат datetime_calcs.astro_frame в профиль.
+
+    :param astro_frame: Поле result ответа astro_frame.
+    """
+    elements_data = astro_frame['elements']
+    planets = astro_frame['planets']
+    signs = []
+    for planet_name in PLANET_CODES:
+        if planet_name in planets and len(planets[planet_name]) > 1 and 0 <= planets[planet_name][1] < UNKNOWN_SIGN:
+            signs.append(planets[planet_name][1])
+        else:
+            signs.append(UNKNOWN_SIGN)
+    return Profile(
+        (
+            elements_data['elements']['fire'] * 100,
+            elements_data['elements']['earth'] * 100,
+            elements_data['elements']['air'] * 100,
+            elements_data['elements']['water'] * 100
+        ),
+        (
+            elements_data['strategy']['cardinal'] * 100,
+            elements_data['strategy']['constant'] * 100,
+            elements_data['strategy']['mutable'] * 100
+        ),
+        tuple(signs)
+    )
+
+
+async def open_upstream_client() -> httpx.AsyncClient:
+    """
+    Создаёт общий пул keep-alive соединений к lifexpert.ru; вызывается при старте приложения.
+    """
+    global upstream_client
+    if upstream_client is None:
+        upstream_client = httpx.AsyncClient(
+            headers={"Content-Type": "application/json"},
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE
+            ),
+            timeout=None
+        )
+    return upstream_client
+
+
+async def close_upstream_client():
+    global upstream_client
+    if upstream_client is not None:
+        await upstream_client.aclose()
+        upstream_client = None
+
+
+async def post_upstream(payload: list) -> httpx.Response:
+    """
+    Отправляет JSON-RPC запрос к lifexpert.ru с дедлайном UPSTREAM_TIMEOUT и хеджированием через upstream_breaker.
+
+    :raises UnavailableError: lifexpert.ru не ответил вовремя, вернул 5xx или выключатель разомкнут.
+    """
+    client = await open_upstream_client()
+
+    async def attempt() -> httpx.Response:
+        try:
+            response = await client.post(LIFEXPERT_URL, json=payload)
+        except httpx.TransportError as e:
+            raise UnavailableError(f"API request failed: {e!r}") from e
+        if response.status_code >= 500:
+            raise UnavailableError(f"API request failed with status code {response.status_code}")
+        return response
+
+    with upstream_seconds.time():
+        return await upstream_breaker.call(
+            lambda: hedged(attempt, UPSTREAM_TIMEOUT, UPSTREAM_HEDGE_DELAY, UPSTREAM_HEDGE_ATTEMPTS)
+        )
+
+
+async def fetch_remote_profile(date_str: str, full_name: str = "", coord: Dict = DEFAULT_COORD) -> Profile:
+    response = await post_upstream(build_payload(date_str, coord))
+    if response.status_code == 200:
+        data = response.json()
+        if not data or 'result' not in data[0]:
+            raise Exception(f"Invalid data received for {full_name or date_str}")
+        return parse_astro_frame(data[0]['result'])
+    else:
+        raise Exception(f"API request failed with status code {response.status_code}")
+
+
+async def call_batches(date_strs: List[str], methods: Sequence[str], coord: Dict = DEFAULT_COORD) -> Dict[str, Dict[str, Dict]]:
+    """
+    Вызывает методы lifexpert.ru для всех дат пакетными JSON-RPC запросами, по PROFILE_BATCH_SIZE дат в одном запросе.
+
+    :param date_strs: Даты рождения, повторы запрашиваются один раз.
+    :param methods: Вызываемые методы datetime_calcs.
+    :param coord: Координаты места рождения.
+    :return: Словарь дата -> {метод: result}.
+    """
+    unique_dates = list(dict.fromkeys(date_strs))
+    chunks = [unique_dates[i:i + PROFILE_BATCH_SIZE] for i in range(0, len(unique_dates), PROFILE_BATCH_SIZE)]
+    semaphore = asyncio.Semaphore(PROFILE_FETCH_CONCURRENCY)
+
+    async def fetch_chunk(chunk: List[str]) -> Dict[str, Dict[str, Dict]]:
+        payload = []
+        call_ids = {}
+        for date_str in chunk:
+            for call in build_payload(date_str, coord, first_id=len(payload) + 1, methods=methods):
+                call_ids[call['id']] = (date_str, call['method'])
+                payload.append(call)
+        async with semaphore:
+            response = await post_upstream(payload)
+        if response.status_code != 200:
+            raise Exception(f"API request failed with status code {response.status_code}")
+        responses = {item.get('id'): item for item in response.json() or []}
+        chunk_results = {date_str: {} for date_str in chunk}
+        for request_id, (date_str, method) in call_ids.items():
+            item = responses.get(request_id)
+            if not item or 'result' not in item:
+                raise Exception(f"Invalid data received for {date_str}")
+            chunk_results[date_str][method] = item['result']
+        return chunk_results
+
+    results = {}
+    for chunk_results in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+        results.update(chunk_results)
+    return results
+
+
+async def fetch_remote_profiles(date_strs: List[str], coord: Dict = DEFAULT_COORD) -> Dict[str, Profile]:
+    results = await call_batches(date_strs, [ASTRO_FRAME], coord)
+    return {date_str: parse_astro_frame(frames[ASTRO_FRAME]) for date_str, frames in results.items()}
+
+
+def calculate_local_profile(date_str: str, coord: Dict = DEFAULT_COORD) -> Profile:
+    return parse_astro_frame(calculate_astro_frame(date_str, coord['lat'], coord['lng']))
+
+
+def check_provider():
+    """
+    Проверяет, что выбранный в PROFILE_PROVIDER провайдер можно использовать.
+
+    :raises RuntimeError: PROFILE_PROVIDER=local, а веса планет не подобраны по ответам lifexpert.ru.
+    """
+    if PROFILE_PROVIDER == "local" and not LOCAL_CALIBRATED:
+        raise RuntimeError(
+            "PROFILE_PROVIDER=local requires planet weights fitted to lifexpert.ru responses "
+            "(python astro_local.py fit recorded.jsonl), see PLANET_WEIGHTS_PATH"
+        )
+
+
+def profile_key(date_str: str, coord: Dict = DEFAULT_COORD) -> tuple:
+    return date_str, coord['lat'], coord['lng']
+
+
+def cached_profile(key: tuple) -> Optional[Profile]:
+    profile = profile_cache.get(key)
+    if profile is None:
+        profile = stored_profiles.get(key)
+    return profile
+
+
+def profile_cache_stats() -> Dict:
+    """
+    Статистика profile_cache, в которой найденные в stored_profiles профили считаются попаданиями,
+    а не промахами: каждое обращение cached_profile учитывается один раз, как в cache_lookups.
+    """
+    stats = profile_cache.stats()
+    stats["hits"] += stored_profiles.hits
+    stats["misses"] -= stored_profiles.hits
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def join_inflight(key: tuple, start) -> asyncio.Future:
+    """
+    Возвращает загрузку профиля key, которая уже выполняется, или запускает новую через start().
+    Одновременные запросы одного профиля ждут одну общую загрузку.
+    """
+    future = inflight_profiles.get(key)
+    if future is None:
+        future = asyncio.ensure_future(start())
+        inflight_profiles[key] = future
+
+        def done(_):
+            del inflight_profiles[key]
+            if not future.cancelled():
+                # Ошибку получают ожидающие запросы; если их уже нет, она не должна попасть в лог asyncio.
+                future.exception()
+
+        future.add_done_callback(done)
+    return future
+
+
+async def load_profile(date_str: str, full_name: str = "", coord: Dict = DEFAULT_COORD) -> Profile:
+    if PROFILE_PROVIDER == "local":
+        profile = calculate_local_profile(date_str, coord)
+    else:
+        try:
+            profile = await fetch_remote_profile(date_str, full_name, coord)
+        except UnavailableError:
+            # Пока lifexpert.ru недоступен, профиль считается локально (если веса подобраны) и не кэшируется.
+            if not LOCAL_CALIBRATED:
+                raise
+            return calculate_local_profile(date_str, coord)
+    profile_cache.set(profile_key(date_str, coord), profile)
+    return profile
+
+
+async def load_profiles(date_strs: List[str], coord: Dict = DEFAULT_COORD) -> Dict[str, Profile]:
+    if PROFILE_PROVIDER == "local":
+        fetched = {date_str: calculate_local_profile(date_str, coord) for date_str in date_strs}
+    else:
+        try:
+            fetched = await fetch_remote_profiles(date_strs, coord)
+        except UnavailableError:
+            if not LOCAL_CALIBRATED:
+                raise
+            return {date_str: calculate_local_profile(date_str, coord) for date_str in date_strs}
+    for date_str, profile in fetched.items():
+        profile_cache.set(profile_key(date_str, coord), profile)
+    return fetched
+
+
+async def get_profile(date_str: str, full_name: str = "", coord: Dict = DEFAULT_COORD) -> Profile:
+    """
+    Возвращает профиль человека из кэша, хранилища профилей или через провайдер, выбранный в PROFILE_PROVIDER.
+
+    :param date_str: Дата рождения в формате, который принимает lifexpert.ru.
+    :param full_name: Имя для сообщений об ошибках.
+    :param coord: Координаты места рождения.
+    """
+    key = profile_key(date_str, coord)
+    profile = cached_profile(key)
+    if profile is not None:
+        cache_lookups.inc("profiles", "hit")
+        return profile
+    cache_lookups.inc("profiles", "miss")
+    with profile_seconds.time():
+        return await asyncio.shield(join_inflight(key, lambda: load_profile(date_str, full_name, coord)))
+
+
+async def get_profiles(people: List, coord: Dict = DEFAULT_COORD) -> List[Profile]:
+    """
+    Возвращает профили группы: берёт найденные в кэше и хранилище профилей, присоединяется к уже идущим загрузкам,
+    остальные загружает пакетно. Если lifexpert.ru недоступен, а веса локального расчёта подобраны,
+    недостающие профили считаются локально и не кэшируются.
+
+    :param people: Список объектов с полем birth_date.
+    :param coord: Координаты места рождения.
+    :return: Профили в порядке входного списка.
+    """
+    started = time.perf_counter()
+    profiles = {}
+    loading = {}
+    missing = []
+    for date_str in dict.fromkeys(person.birth_date for person in people):
+        key = profile_key(date_str, coord)
+        profile = cached_profile(key)
+        if profile is not None:
+            profiles[date_str] = profile
+        elif key in inflight_profiles:
+            loading[date_str] = inflight_profiles[key]
+        else:
+            missing.append(date_str)
+    cache_lookups.inc("profiles", "hit", amount=len(profiles))
+    cache_lookups.inc("profiles", "miss", amount=len(loading) + len(missing))
+    if missing:
+        batch = asyncio.ensure_future(load_profiles(missing, coord))
+
+        async def batch_item(date_str: str) -> Profile:
+            return (await batch)[date_str]
+
+        for date_str in missing:
+            loading[date_str] = join_inflight(profile_key(date_str, coord), lambda date_str=date_str: batch_item(date_str))
+    if loading:
+        async def timed_load(future: asyncio.Future) -> Profile:
+            with profile_seconds.time():
+                return await asyncio.shield(future)
+
+        results = await asyncio.gather(*(timed_load(future) for future in loading.values()), return_exceptions=True)
+        for date_str, result in zip(loading, results):
+            if isinstance(result, BaseException):
+                raise result
+            profiles[date_str] = result
+    profiles_seconds.observe(time.perf_counter() - started)
+    return [profiles[person.birth_date] for person in people]
+
+
+async def get_extra_frames(people: List) -> List[Dict]:
+    """
+    Загружает destinywill и pifagor_frame; вызывается только при detail="full".
+
+    :param people: Список объектов с полями birth_date и full_name.
+    :return: Фреймы каждого человека в порядке входного списка.
+    """
+    frames = {}
+    missing = []
+    for date_str in dict.fromkeys(person.birth_date for person in people):
+        cached = frames_cache.get(date_str)
+        if cached is None:
+            missing.append(date_str)
+        else:
+            frames[date_str] = cached
+    if missing:
+        fetched = await call_batches(missing, EXTRA_FRAME_METHODS)
+        for date_str, date_frames in fetched.items():
+            date_frames = {method.split('.')[-1]: result for method, result in date_frames.items()}
+            frames_cache.set(date_str, date_frames)
+            frames[date_str] = date_frames
+    return [{"full_name": person.full_name, **frames[person.birth_date]} for person in people]
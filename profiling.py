@@ -0,0 +1,118 @@
+"""
+Профилирование отдельных запросов к /api/cosmostat.
+
+Запрос профилируется, если в нём передан заголовок X-Profile-Token, равный PROFILE_ADMIN_TOKEN,
+или он попал в случайную долю PROFILE_SAMPLE_RATE. Запрос выполняется под cProfile; в PROFILE_DIR
+сохраняются <id>.prof (для pstats или snakeviz) и <id>.json с временем ожидания lifexpert.ru
+и GigaChat по метрикам и самыми долгими функциями. Идентификатор возвращается в заголовке X-Profile-Id.
+
+cProfile видит весь поток событийного цикла, поэтому в профиль попадают и запросы, выполнявшиеся
+одновременно с профилируемым. Одновременно профилируется не больше одного запроса.
+"""
+from typing import Callable, Dict, Optional
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import time
+import uuid
+
+from metrics import request_labels, upstream_seconds, llm_token_seconds, llm_completion_seconds
+from settings import PROFILE_ADMIN_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_DIR
+
+PROFILED_PREFIX = "/api/cosmostat"
+TOP_FUNCTIONS = 30
+WAIT_STAGES = {
+    "upstream": upstream_seconds.name,
+    "llm_token": llm_token_seconds.name,
+    "llm_completion": llm_completion_seconds.name
+}
+
+
+def should_profile(scope: Dict) -> bool:
+    if not scope["path"].startswith(PROFILED_PREFIX):
+        return False
+    if PROFILE_ADMIN_TOKEN:
+        for name, value in scope["headers"]:
+            if name == b"x-profile-token" and hmac.compare_digest(value, PROFILE_ADMIN_TOKEN.encode()):
+                return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def top_functions(profiler: cProfile.Profile, limit: int = TOP_FUNCTIONS):
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    # Сортировка по собственному времени: по накопленному впереди всегда оказывается событийный цикл.
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "own_seconds": own,
+            "cumulative_seconds": cumulative
+        }
+        for (filename, line, name), (_, calls, own, cumulative, _) in rows
+    ]
+
+
+def save_profile(profile_id: str, profiler: cProfile.Profile, report: Dict):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{profile_id}.prof"))
+    report["top_functions"] = top_functions(profiler)
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware профилирования; должна стоять внутри MetricsMiddleware, чтобы собрать время этапов.
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+        self.active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.active or not should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        status: Optional[int] = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        labels = request_labels.get()
+        if labels is not None:
+            labels.stages = {}
+        self.active = True
+        profiler = cProfile.Profile()
+        started_at = time.time()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            self.active = False
+            seconds = time.perf_counter() - started
+            stages = labels.stages if labels is not None else {}
+            # Ожидания могут идти параллельно, поэтому их сумма бывает больше времени запроса.
+            waits = {wait: stages.get(name, [0.0])[0] for wait, name in WAIT_STAGES.items()}
+            save_profile(profile_id, profiler, {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "started_at": started_at,
+                "seconds": seconds,
+                "waits": waits,
+                "stages": {name: {"seconds": total, "count": count} for name, (total, count) in stages.items()}
+            })
@@ -0,0 +1,98 @@
+"""
+Ограничение времени ожидания внешних сервисов: дедлайны, хеджированные запросы и автоматический выключатель.
+"""
+from typing import Awaitable, Callable, Dict, TypeVar
+import asyncio
+import time
+
+T = TypeVar("T")
+
+
+class UnavailableError(Exception):
+    """
+    Сервис не ответил вовремя, вернул 5xx или отключён выключателем.
+    """
+
+
+class CircuitBreaker:
+    """
+    Размыкается после failure_threshold ошибок подряд и reset_timeout секунд не пропускает вызовы.
+    Затем вызовы снова разрешаются: первая ошибка размыкает его опять, первый успех замыкает.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+
+    def is_open(self) -> bool:
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if not self.is_open():
+                self.trips += 1
+            self.opened_at = time.monotonic()
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполняет func, если выключатель замкнут; UnavailableError из func считается ошибкой.
+        """
+        if self.is_open():
+            raise UnavailableError("Service is temporarily unavailable")
+        try:
+            result = await func()
+        except UnavailableError:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            "open": self.is_open(),
+            "failures": self.failures,
+            "trips": self.trips
+        }
+
+
+async def hedged(attempt: Callable[[], Awaitable[T]], timeout: float, hedge_delay: float, attempts: int) -> T:
+    """
+    Выполняет attempt с общим дедлайном timeout секунд.
+
+    Если ответа нет через hedge_delay секунд или попытка завершилась ошибкой, запускается
+    ещё одна, всего не больше attempts. Возвращается первый успешный результат,
+    остальные попытки отменяются.
+
+    :raises UnavailableError: Ни одна попытка не успела до дедлайна.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    pending = {asyncio.ensure_future(attempt())}
+    started = 1
+    error = None
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise UnavailableError(f"No response within {timeout:g} s")
+            wait = min(remaining, hedge_delay) if started < attempts else remaining
+            done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if started < attempts and (not done or not pending):
+                pending.add(asyncio.ensure_future(attempt()))
+                started += 1
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,299 @@
+from dataclasses import dataclass, replace
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+
+from compat_matrix import build_matrix, pack_profiles
+from metrics import scoring_seconds, cache_lookups
+from explanations import (
+    DEFAULT_LANGUAGE, LEVELS, SECTION_ELEMENTS, SECTION_STRATEGIES, SECTION_ASTROLOGY,
+    ELEMENT_BOTH_DOMINANT, ELEMENT_BALANCED, ELEMENT_UNBALANCED, ELEMENTS_NONE_DOMINANT, ELEMENTS_MANY_DOMINANT,
+    STRATEGY_BOTH_DOMINANT, STRATEGY_BALANCED, STRATEGY_DIFFERENT, STRATEGIES_SINGLE_DOMINANT, STRATEGIES_MANY_DOMINANT,
+    SUN_MOON_HARMONY, SUN_MOON_DISHARMONY, VENUS_MARS_HARMONY, VENUS_MARS_DISHARMONY, SUN_SAME_ELEMENT, SUN_DIFFERENT_ELEMENT,
+    render_explanations, mirror_explanations
+)
+from profiles import Profile, ELEMENT_IDS, STRATEGY_IDS, SIGN_LETTERS, SUN, MOON, VENUS, MARS
+from profile_cache import TTLCache
+from settings import MATRIX_VECTORIZE_MIN_SIZE, PAIR_CACHE_SIZE, PAIR_CACHE_TTL
+
+
+# Общий для всех эндпоинтов кэш пар: по ключу пары лежит либо CompatibilityResult
+# (two-people), либо только балл (department).
+pair_cache = TTLCache(PAIR_CACHE_SIZE, PAIR_CACHE_TTL)
+
+
+@dataclass
+class CompatibilityResult:
+    total_score: int
+    compatibility_level: str
+    explanations: Dict[str, List]
+
+
+def compatibility_level_code(total_score: float) -> str:
+    if total_score >= 8:
+        return "high"
+    elif 4 <= total_score < 8:
+        return "medium"
+    else:
+        return "low"
+
+
+def compatibility_level(total_score: float, language: str = DEFAULT_LANGUAGE) -> str:
+    return LEVELS[language][compatibility_level_code(total_score)]
+
+
+async def analyze_elements(elements1: Sequence[float], elements2: Sequence[float]):
+    score = 0
+    explanation = []
+    for k, element in enumerate(ELEMENT_IDS):
+        if elements1[k] > 40 and elements2[k] > 40:
+            score -= 2
+            explanation.append((ELEMENT_BOTH_DOMINANT, element))
+        elif abs(elements1[k] - elements2[k]) < 20:
+            score += 2
+            explanation.append((ELEMENT_BALANCED, element))
+        else:
+            explanation.append((ELEMENT_UNBALANCED, element, round(elements1[k], 1), round(elements2[k], 1)))
+    dominant_elements1 = sum(1 for v in elements1 if v > 40)
+    dominant_elements2 = sum(1 for v in elements2 if v > 40)
+    if dominant_elements1 == 0 and dominant_elements2 == 0:
+        score += 3
+        explanation.append((ELEMENTS_NONE_DOMINANT,))
+    elif dominant_elements1 > 1 or dominant_elements2 > 1:
+        score -= 3
+        explanation.append((ELEMENTS_MANY_DOMINANT,))
+    return score, explanation
+
+
+async def analyze_behaviors(behaviors1: Sequence[float], behaviors2: Sequence[float]):
+    score = 0
+    explanation = []
+    for k, strategy in enumerate(STRATEGY_IDS):
+        if behaviors1[k] > 40 and behaviors2[k] > 40:
+            score -= 2
+            explanation.append((STRATEGY_BOTH_DOMINANT, strategy))
+        elif abs(behaviors1[k] - behaviors2[k]) < 20:
+            score += 3
+            explanation.append((STRATEGY_BALANCED, strategy))
+        else:
+            explanation.append((STRATEGY_DIFFERENT, strategy, round(behaviors1[k], 1), round(behaviors2[k], 1)))
+    dominant_strategies1 = sum(1 for v in behaviors1 if v > 40)
+    dominant_strategies2 = sum(1 for v in behaviors2 if v > 40)
+    if dominant_strategies1 == 1 and dominant_strategies2 == 1:
+        score += 2
+        explanation.append((STRATEGIES_SINGLE_DOMINANT,))
+    elif dominant_strategies1 > 1 or dominant_strategies2 > 1:
+        score -= 2
+        explanation.append((STRATEGIES_MANY_DOMINANT,))
+    return score, explanation
+
+
+async def analyze_astrology(signs1: Sequence[int], signs2: Sequence[int]):
+    score = 0
+    explanation = []
+    if signs1[SUN] == signs2[MOON] or signs2[SUN] == signs1[MOON]:
+        score += 3
+        explanation.append((SUN_MOON_HARMONY,))
+    else:
+        score -= 1
+        explanation.append((SUN_MOON_DISHARMONY,))
+    if signs1[VENUS] == signs2[MARS] or signs2[VENUS] == signs1[MARS]:
+        score += 2
+        explanation.append((VENUS_MARS_HARMONY,))
+    else:
+        score -= 2
+        explanation.append((VENUS_MARS_DISHARMONY,))
+    if SIGN_LETTERS[signs1[SUN]] == SIGN_LETTERS[signs2[SUN]]:
+        score += 2
+        explanation.append((SUN_SAME_ELEMENT,))
+    else:
+        explanation.append((SUN_DIFFERENT_ELEMENT,))
+    return score, explanation
+
+
+async def calculate_compatibility(profile1: Profile, profile2: Profile) -> CompatibilityResult:
+    """
+    Считает совместимость двух профилей; пояснения возвращаются кодами, текст собирает render_result.
+    """
+    element_score, element_explanation = await analyze_elements(profile1.elements, profile2.elements)
+    behavior_score, behavior_explanation = await analyze_behaviors(profile1.strategies, profile2.strategies)
+    astrology_score, astrology_explanation = await analyze_astrology(profile1.signs, profile2.signs)
+
+    total_score = element_score + behavior_score + astrology_score
+    explanations = {
+        SECTION_ELEMENTS: element_explanation,
+        SECTION_STRATEGIES: behavior_explanation,
+        SECTION_ASTROLOGY: astrology_explanation,
+    }
+    return CompatibilityResult(total_score=total_score, compatibility_level=compatibility_level_code(total_score), explanations=explanations)
+
+
+def render_result(result: CompatibilityResult, language: str = DEFAULT_LANGUAGE, codes_only: bool = False) -> CompatibilityResult:
+    """
+    Готовит результат к ответу: текст пояснений и уровня на выбранном языке либо только коды.
+
+    Исходный результат не меняется, поэтому его можно кэшировать.
+    """
+    if codes_only:
+        return CompatibilityResult(
+            total_score=result.total_score,
+            compatibility_level=compatibility_level_code(result.total_score),
+            explanations=result.explanations
+        )
+    return CompatibilityResult(
+        total_score=result.total_score,
+        compatibility_level=compatibility_level(result.total_score, language),
+        explanations=render_explanations(result.explanations, language)
+    )
+
+
+def score_pair(profile1: Profile, profile2: Profile) -> int:
+    """
+    Считает только итоговый балл по правилам calculate_compatibility, без строк пояснений.
+    """
+    elements1, elements2 = profile1.elements, profile2.elements
+    strategies1, strategies2 = profile1.strategies, profile2.strategies
+    signs1, signs2 = profile1.signs, profile2.signs
+    score = 0
+
+    dominant1 = dominant2 = 0
+    for k in range(4):
+        value1 = elements1[k]
+        value2 = elements2[k]
+        if value1 > 40:
+            dominant1 += 1
+        if value2 > 40:
+            dominant2 += 1
+        if value1 > 40 and value2 > 40:
+            score -= 2
+        elif abs(value1 - value2) < 20:
+            score += 2
+    if dominant1 == 0 and dominant2 == 0:
+        score += 3
+    elif dominant1 > 1 or dominant2 > 1:
+        score -= 3
+
+    dominant1 = dominant2 = 0
+    for k in range(3):
+        value1 = strategies1[k]
+        value2 = strategies2[k]
+        if value1 > 40:
+            dominant1 += 1
+        if value2 > 40:
+            dominant2 += 1
+        if value1 > 40 and value2 > 40:
+            score -= 2
+        elif abs(value1 - value2) < 20:
+            score += 3
+    if dominant1 == 1 and dominant2 == 1:
+        score += 2
+    elif dominant1 > 1 or dominant2 > 1:
+        score -= 2
+
+    score += 3 if signs1[SUN] == signs2[MOON] or signs2[SUN] == signs1[MOON] else -1
+    score += 2 if signs1[VENUS] == signs2[MARS] or signs2[VENUS] == signs1[MARS] else -2
+    if SIGN_LETTERS[signs1[SUN]] == SIGN_LETTERS[signs2[SUN]]:
+        score += 2
+    return score
+
+
+def pair_key(profile1: Profile, profile2: Profile) -> Tuple[Hashable, bool]:
+    """
+    Ключ пары, не зависящий от порядка профилей.
+
+    :return: Ключ и признак того, что профили стоят в обратном каноническому порядке.
+    """
+    fingerprint1 = profile1.fingerprint
+    fingerprint2 = profile2.fingerprint
+    if fingerprint1 <= fingerprint2:
+        return (fingerprint1, fingerprint2), False
+    return (fingerprint2, fingerprint1), True
+
+
+async def cached_compatibility(profile1: Profile, profile2: Profile) -> CompatibilityResult:
+    """
+    calculate_compatibility через pair_cache. Результат хранится для канонического порядка пары
+    и при обратном порядке отдаётся с переставленными значениями в пояснениях.
+    """
+    key, swapped = pair_key(profile1, profile2)
+    result = pair_cache.get(key)
+    if not isinstance(result, CompatibilityResult):
+        cache_lookups.inc("pairs", "miss")
+        with scoring_seconds.time("pair"):
+            if swapped:
+                result = await calculate_compatibility(profile2, profile1)
+            else:
+                result = await calculate_compatibility(profile1, profile2)
+        pair_cache.set(key, result)
+    else:
+        cache_lookups.inc("pairs", "hit")
+    if swapped:
+        return replace(result, explanations=mirror_explanations(result.explanations))
+    return result
+
+
+def cached_score(profile1: Profile, profile2: Profile) -> int:
+    """
+    score_pair через pair_cache; подходит и запись, оставленная эндпоинтом two-people.
+    """
+    key, _ = pair_key(profile1, profile2)
+    cached = pair_cache.get(key)
+    cache_lookups.inc("pairs", "miss" if cached is None else "hit")
+    if cached is None:
+        score = score_pair(profile1, profile2)
+        pair_cache.set(key, score)
+        return score
+    if isinstance(cached, CompatibilityResult):
+        return cached.total_score
+    return cached
+
+
+def group_profiles(profiles: List[Profile]) -> Tuple[List[Profile], np.ndarray]:
+    """
+    Объединяет одинаковые профили в классы.
+
+    :return: Уникальные профили и номер класса для каждого входного профиля.
+    """
+    index = {}
+    unique = []
+    classes = np.empty(len(profiles), dtype=np.intp)
+    for i, profile in enumerate(profiles):
+        class_index = index.get(profile)
+        if class_index is None:
+            class_index = index[profile] = len(unique)
+            unique.append(profile)
+        classes[i] = class_index
+    return unique, classes
+
+
+def _pairwise_matrix(profiles: List[Profile], zero_diagonal: bool) -> np.ndarray:
+    n = len(profiles)
+    if n >= MATRIX_VECTORIZE_MIN_SIZE:
+        return build_matrix(pack_profiles(profiles), zero_diagonal=zero_diagonal)
+    matrix = np.zeros((n, n), dtype=np.int32)
+    for i in range(n):
+        start = i if not zero_diagonal else i + 1
+        for j in range(start, n):
+            matrix[i, j] = matrix[j, i] = cached_score(profiles[i], profiles[j])
+    return matrix
+
+
+def score_matrix(profiles: List[Profile], grouped: Optional[Tuple[List[Profile], np.ndarray]] = None) -> np.ndarray:
+    """
+    Считает матрицу совместимости группы без пояснений.
+
+    Одинаковые профили (например, у сотрудников с одной датой рождения) считаются один раз:
+    баллы считаются для пар классов и разворачиваются обратно на сотрудников.
+    Небольшие группы считаются попарно через pair_cache, остальные — векторно в compat_matrix.
+
+    :param profiles: Профили сотрудников.
+    :param grouped: Результат group_profiles(profiles), если он уже посчитан.
+    :return: Симметричная матрица n×n типа int32 с нулевой диагональю.
+    """
+    with scoring_seconds.time("matrix"):
+        unique, classes = grouped if grouped is not None else group_profiles(profiles)
+        if len(unique) == len(profiles):
+            return _pairwise_matrix(profiles, zero_diagonal=True)
+        # Диагональ матрицы классов нужна: это балл двух разных сотрудников с одинаковым профилем.
+        matrix = _pairwise_matrix(unique, zero_diagonal=False)[np.ix_(classes, classes)]
+        np.fill_diagonal(matrix, 0)
+        return matrix
@@ -0,0 +1,87 @@
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Источник профилей: "remote" — lifexpert.ru, "local" — Swiss Ephemeris.
+PROFILE_PROVIDER = os.getenv('PROFILE_PROVIDER', 'remote')
+LIFEXPERT_URL = os.getenv('LIFEXPERT_URL', 'https://www.lifexpert.ru/jui/rpc/')
+
+# Путь к файлам эфемерид; если не задан, используется встроенная модель Moshier.
+EPHE_PATH = os.getenv('EPHE_PATH')
+# Часовой пояс, в котором указана birth_date (часы от UTC).
+BIRTH_TZ_OFFSET = float(os.getenv('BIRTH_TZ_OFFSET', '3'))
+# Веса планет для локального расчёта, подобранные по ответам lifexpert.ru (python astro_local.py fit).
+# Пока файла нет, локальный расчёт не подменяет недоступный lifexpert.ru.
+PLANET_WEIGHTS_PATH = os.getenv('PLANET_WEIGHTS_PATH', 'planet_weights.json')
+
+# Кэш профилей: число записей и время жизни в секундах (0 — без ограничения).
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '10000'))
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', '86400'))
+# Файл с заранее посчитанными профилями (python prewarm.py); загружается при старте и не устаревает. Пусто — не используется.
+PROFILE_STORE_PATH = os.getenv('PROFILE_STORE_PATH', '')
+
+# Пул соединений к lifexpert.ru и число одновременных запросов профилей в одном отделе.
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '100'))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv('UPSTREAM_MAX_KEEPALIVE', '20'))
+PROFILE_FETCH_CONCURRENCY = int(os.getenv('PROFILE_FETCH_CONCURRENCY', '20'))
+# Сколько дат рождения упаковывается в один пакетный JSON-RPC запрос.
+PROFILE_BATCH_SIZE = int(os.getenv('PROFILE_BATCH_SIZE', '50'))
+
+# Детализация профиля по умолчанию для эндпоинтов: "astro" или "full".
+TWO_PEOPLE_DETAIL = os.getenv('TWO_PEOPLE_DETAIL', 'astro')
+DEPARTMENT_DETAIL = os.getenv('DEPARTMENT_DETAIL', 'astro')
+
+# Сколько строк матрицы совместимости считается за один векторный проход.
+MATRIX_TILE_SIZE = int(os.getenv('MATRIX_TILE_SIZE', '256'))
+# Начиная с какого размера отдела матрица считается векторно; меньшие группы — попарно.
+MATRIX_VECTORIZE_MIN_SIZE = int(os.getenv('MATRIX_VECTORIZE_MIN_SIZE', '12'))
+# Отделы, в которых не меньше MATRIX_POOL_MIN_SIZE разных профилей, считаются блоками строк
+# в пуле из MATRIX_POOL_WORKERS процессов (0 — всегда в основном процессе).
+MATRIX_POOL_MIN_SIZE = int(os.getenv('MATRIX_POOL_MIN_SIZE', '1000'))
+MATRIX_POOL_WORKERS = int(os.getenv('MATRIX_POOL_WORKERS', str(os.cpu_count() or 1)))
+
+# Сохранённые отделы: сколько держать в памяти и сколько секунд (0 — без ограничения).
+DEPARTMENT_STORE_SIZE = int(os.getenv('DEPARTMENT_STORE_SIZE', '1000'))
+DEPARTMENT_TTL = float(os.getenv('DEPARTMENT_TTL', '0'))
+
+# Кэш баллов пар профилей, общий для two-people и department.
+PAIR_CACHE_SIZE = int(os.getenv('PAIR_CACHE_SIZE', '100000'))
+PAIR_CACHE_TTL = float(os.getenv('PAIR_CACHE_TTL', '0'))
+
+# GigaChat: доступ, адреса и сертификат Минцифры для TLS.
+RQUID = os.getenv('RQUID')
+AUTHKEY = os.getenv('AUTHKEY')
+GIGACHAT_OAUTH_URL = os.getenv('GIGACHAT_OAUTH_URL', 'https://ngw.devices.sberbank.ru:9443/api/v2/oauth')
+GIGACHAT_URL = os.getenv('GIGACHAT_URL', 'https://gigachat.devices.sberbank.ru/api/v1/chat/completions')
+GIGACHAT_CA_BUNDLE = os.getenv('GIGACHAT_CA_BUNDLE', 'chain.pem')
+# Токен обновляется в фоне, когда до истечения остаётся меньше GIGACHAT_TOKEN_REFRESH_AHEAD секунд,
+# и перестаёт использоваться за GIGACHAT_TOKEN_MARGIN секунд до истечения.
+GIGACHAT_TOKEN_REFRESH_AHEAD = float(os.getenv('GIGACHAT_TOKEN_REFRESH_AHEAD', '300'))
+GIGACHAT_TOKEN_MARGIN = float(os.getenv('GIGACHAT_TOKEN_MARGIN', '30'))
+# Пул соединений к GigaChat и сколько пар навыков оценивается одним запросом.
+GIGACHAT_MAX_CONNECTIONS = int(os.getenv('GIGACHAT_MAX_CONNECTIONS', '20'))
+GIGACHAT_SKILLS_BATCH_SIZE = int(os.getenv('GIGACHAT_SKILLS_BATCH_SIZE', '20'))
+# Матрица навыков отдела: сколько запросов к GigaChat идёт одновременно и сколько секунд
+# на них отводится, после чего неоценённые пары получают 0.
+GIGACHAT_SKILLS_CONCURRENCY = int(os.getenv('GIGACHAT_SKILLS_CONCURRENCY', '4'))
+GIGACHAT_SKILLS_BUDGET = float(os.getenv('GIGACHAT_SKILLS_BUDGET', '10'))
+# Рекомендации HR в v4: сколько запросов к GigaChat идёт одновременно и сколько секунд
+# на них отводится в одном запросе к API, после чего берутся готовые рекомендации.
+RECOMMENDATION_CONCURRENCY = int(os.getenv('RECOMMENDATION_CONCURRENCY', '8'))
+RECOMMENDATION_BUDGET = float(os.getenv('RECOMMENDATION_BUDGET', '10'))
+# Дедлайны внешних вызовов в секундах. Запрос к lifexpert.ru без ответа за UPSTREAM_HEDGE_DELAY
+# дублируется, всего не больше UPSTREAM_HEDGE_ATTEMPTS попыток.
+UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', '5'))
+UPSTREAM_HEDGE_DELAY = float(os.getenv('UPSTREAM_HEDGE_DELAY', '1'))
+UPSTREAM_HEDGE_ATTEMPTS = int(os.getenv('UPSTREAM_HEDGE_ATTEMPTS', '2'))
+GIGACHAT_TIMEOUT = float(os.getenv('GIGACHAT_TIMEOUT', '10'))
+# Выключатель: после BREAKER_FAILURE_THRESHOLD ошибок подряд сервис не вызывается BREAKER_RESET_TIMEOUT секунд,
+# профили в это время считаются локально, а обогащение через GigaChat пропускается.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+# Профилирование отдельных запросов: заголовок X-Profile-Token с PROFILE_ADMIN_TOKEN (пусто — отключено)
+# или случайная доля запросов PROFILE_SAMPLE_RATE. Результаты пишутся в PROFILE_DIR.
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'request_profiles')
@@ -0,0 +1,20 @@
+from typing import Dict
+import json
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def encode_event(event: Dict, stream_format: str) -> str:
+    """
+    Кодирует событие потока: строка JSON для NDJSON или блок event/data для Server-Sent Events.
+
+    :param event: Словарь с обязательным полем type.
+    :param stream_format: "ndjson" или "sse".
+    """
+    data = json.dumps(event, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
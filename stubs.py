@@ -0,0 +1,202 @@
+"""
+Локальные заглушки lifexpert.ru и GigaChat для бенчмарков и нагрузочных тестов.
+
+Ответы astro_frame заранее посчитаны astro_local для дат одного года и раздаются по хэшу даты,
+поэтому заглушка почти не тратит процессор. Задержка и доля ответов 503 настраиваются:
+
+    python stubs.py --port 8801 --latency 0.05 --gigachat-latency 0.3 --error-rate 0.01
+
+Адреса для API: LIFEXPERT_URL=http://127.0.0.1:8801/lifexpert,
+GIGACHAT_OAUTH_URL=http://127.0.0.1:8801/gigachat/oauth, GIGACHAT_URL=http://127.0.0.1:8801/gigachat/chat
+(см. stub_env).
+"""
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import zlib
+
+import certifi
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from astro_local import calculate_astro_frame
+from profiles import ASTRO_FRAME, DEFAULT_COORD
+
+SKILLS_BATCH_PREFIX = "Оценить совместимость наборов"
+SKILLS_PREFIX = "Оценить совместимость двух"
+STUB_RECOMMENDATION = "Обсудите с сотрудником цели и поддержку на квартал."
+
+
+def recorded_frames(count: int = 366) -> List[Dict]:
+    start = date(2000, 1, 1)
+    return [
+        calculate_astro_frame((start + timedelta(days=i)).isoformat(), DEFAULT_COORD["lat"], DEFAULT_COORD["lng"])
+        for i in range(count)
+    ]
+
+
+def stub_score(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8")) % 11
+
+
+def create_stub_app(latency: float = 0.0, gigachat_latency: float = 0.0, error_rate: float = 0.0, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    frames = recorded_frames()
+    rng = random.Random(seed)
+    app.state.counts = {"lifexpert": 0, "oauth": 0, "chat": 0, "errors": 0}
+
+    def failed() -> bool:
+        if error_rate and rng.random() < error_rate:
+            app.state.counts["errors"] += 1
+            return True
+        return False
+
+    @app.post("/lifexpert")
+    async def lifexpert(request: Request):
+        app.state.counts["lifexpert"] += 1
+        calls = await request.json()
+        await asyncio.sleep(latency)
+        if failed():
+            return JSONResponse(status_code=503, content={})
+        results = []
+        for call in calls:
+            if call["method"] == ASTRO_FRAME:
+                result = frames[zlib.crc32(call["params"]["date"].encode("utf-8")) % len(frames)]
+            else:
+                result = {}
+            results.append({"jsonrpc": "2.0", "id": call["id"], "result": result})
+        return results
+
+    @app.post("/gigachat/oauth")
+    async def oauth():
+        app.state.counts["oauth"] += 1
+        await asyncio.sleep(gigachat_latency)
+        return {"access_token": "stub", "expires_at": int((time.time() + 1800) * 1000)}
+
+    @app.post("/gigachat/chat")
+    async def chat(request: Request):
+        app.state.counts["chat"] += 1
+        body = await request.json()
+        await asyncio.sleep(gigachat_latency)
+        if failed():
+            return JSONResponse(status_code=503, content={})
+        system, user = body["messages"][0]["content"], body["messages"][1]["content"]
+        if system.startswith(SKILLS_BATCH_PREFIX):
+            content = json.dumps([stub_score(line) for line in user.split("\n")])
+        elif system.startswith(SKILLS_PREFIX):
+            content = str(stub_score(user))
+        else:
+            content = STUB_RECOMMENDATION
+        return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.counts
+
+    return app
+
+
+def stub_env(stub_url: str) -> Dict[str, str]:
+    """
+    Переменные окружения, направляющие API на заглушки по адресу stub_url.
+    """
+    return {
+        "PROFILE_PROVIDER": "remote",
+        "PROFILE_STORE_PATH": "",
+        "LIFEXPERT_URL": f"{stub_url}/lifexpert",
+        "GIGACHAT_OAUTH_URL": f"{stub_url}/gigachat/oauth",
+        "GIGACHAT_URL": f"{stub_url}/gigachat/chat",
+        "GIGACHAT_CA_BUNDLE": certifi.where(),
+        "RQUID": "stub",
+        "AUTHKEY": "stub",
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_process(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *args],
+        env={**os.environ, **(env or {})},
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} is not ready after {timeout:g} s")
+
+
+def start_stubs(latency: float = 0.0, gigachat_latency: float = 0.0, error_rate: float = 0.0):
+    """
+    Запускает заглушки в отдельном процессе.
+
+    :return: Процесс и адрес заглушек.
+    """
+    port = free_port()
+    process = start_process([
+        os.path.abspath(__file__), "--port", str(port), "--latency", str(latency),
+        "--gigachat-latency", str(gigachat_latency), "--error-rate", str(error_rate)
+    ])
+    url = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{url}/stats", process)
+    return process, url
+
+
+def start_app(module: str, stub_url: str, env: Optional[Dict[str, str]] = None):
+    """
+    Запускает API module под uvicorn в отдельном процессе, направив его на заглушки.
+
+    :return: Процесс и адрес API.
+    """
+    port = free_port()
+    process = start_process(
+        ["-m", "uvicorn", f"{module}:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        {**stub_env(stub_url), **(env or {})}
+    )
+    url = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{url}/api/cosmostat/cache", process)
+    return process, url
+
+
+def stop_process(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Заглушки lifexpert.ru и GigaChat")
+    parser.add_argument("--port", type=int, default=8801)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка lifexpert.ru, с")
+    parser.add_argument("--gigachat-latency", type=float, default=0.0, help="задержка GigaChat, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    args = parser.parse_args()
+    uvicorn.run(create_stub_app(args.latency, args.gigachat_latency, args.error_rate), host="127.0.0.1", port=args.port, log_level="warning")